@@ -0,0 +1,394 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Batch export of biographies for many people.
+
+Bios are generated in a process pool. Each worker process opens its own
+read-only connection to the family tree, so nothing but handles and text
+crosses process boundaries.
+
+With --incremental, the objects each bio was built from are recorded in a
+sidecar file, and people whose dependencies have not changed since the
+last run are skipped.
+
+Usage:
+    python batchexport.py TREE_DIR [--filter NAME] [--incremental]
+                          [--output DIR | --jsonl FILE]
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import traceback
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.db.dbconst import DBMODE_R
+from gramps.gen.db.utils import make_database, get_dbid_from_path
+
+
+# Other gramplet modules
+from biogenerator import generate_bio, find_templates
+from dependencies import (TrackingDb, DependencyStore, is_up_to_date,
+                          text_hash)
+from services import get_wikitree_attributes
+
+
+
+# Per-process state of a worker
+_worker_db = None
+_worker_options = None
+_worker_templates = None
+_worker_templates_hash = None
+
+
+
+def open_database_readonly(path):
+    """
+    Open the family tree stored in the given directory, read-only.
+    """
+    db = make_database(get_dbid_from_path(path))
+    db.load(path, callback=None, mode=DBMODE_R)
+    return db
+
+
+def find_linked_people(db, filter_name=None):
+    """
+    Return the handles of the people to export: the people matched by the
+    named custom person filter, or else everyone with a WikiTree attribute.
+    """
+    if filter_name:
+        from gramps.gen.filters import CustomFilters, reload_custom_filters
+        reload_custom_filters()
+        filters = CustomFilters.get_filters_dict('Person')
+        if filter_name not in filters:
+            raise ValueError("Unknown person filter: %s" % filter_name)
+        return filters[filter_name].apply(db, list(db.iter_person_handles()))
+
+    handles = []
+    for person in db.iter_people():
+        if get_wikitree_attributes(db, person):
+            handles.append(person.get_handle())
+    return handles
+
+
+def _init_worker(path, options):
+    """
+    Open the database once per worker process.
+    """
+    global _worker_db, _worker_options, _worker_templates, \
+           _worker_templates_hash
+    _worker_db = open_database_readonly(path)
+    _worker_options = options
+    _worker_templates = find_templates(_worker_db)
+    _worker_templates_hash = text_hash(repr(_worker_templates))
+
+
+def _generate_one(person_handle, record=None):
+    """
+    Generate the bio for one person in a worker process. If the stored
+    record shows nothing the bio depends on has changed, skip it. Errors
+    are returned, not raised, so one bad person does not stop the batch.
+    """
+    result = {'handle': person_handle, 'id': None, 'bio': None, 'error': None,
+              'skipped': False}
+    start = time.perf_counter()
+    try:
+        if record is not None and is_up_to_date(_worker_db, record,
+                                                  _worker_options,
+                                                  _worker_templates_hash):
+            result['id'] = record.get('id')
+            result['gramps_id'] = record.get('gramps_id')
+            result['skipped'] = True
+        else:
+            db = TrackingDb(_worker_db)
+            person = db.get_person_from_handle(person_handle)
+            wt_attrs = get_wikitree_attributes(db, person)
+            result['id'] = wt_attrs['id'] if wt_attrs else None
+            result['gramps_id'] = person.get_gramps_id()
+            result['bio'] = generate_bio(db, person,
+                                         templates=_worker_templates,
+                                         **_worker_options)
+            result['record'] = {'id': result['id'],
+                                'gramps_id': result['gramps_id'],
+                                'options': _worker_options,
+                                'templates': _worker_templates_hash,
+                                'deps': db.dependencies(),
+                                'hash': text_hash(result['bio'])}
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+def jsonl_offsets(path):
+    """
+    Offset of the line of each person with a bio in a JSONL file written
+    by an earlier run.
+    """
+    offsets = {}
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            result = json.loads(line)
+            if result.get('bio') is not None:
+                offsets[result['handle']] = offset
+            offset += len(line)
+    return offsets
+
+
+def safe_name(name):
+    """
+    An id with the characters that are not safe in file names replaced.
+    """
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def output_name(result):
+    """
+    File name for a bio: the WikiTree id, or the Gramps id for people
+    who are not linked yet.
+    """
+    name = result['id'] or result.get('gramps_id') or result['handle']
+    return safe_name(name) + '.txt'
+
+
+
+#====================================================
+#
+# Class BatchExport
+#
+#====================================================
+
+class BatchExport:
+    """
+    Generate bios for a list of people in a process pool, writing them
+    either to one file per WikiTree id or to a single JSONL stream.
+    """
+
+    def __init__(self, db_path, handles, output_dir=None, jsonl_file=None,
+                 workers=None, progress=None, store_path=None, **options):
+        """
+        options are passed to BioGenerator (include_witness_events,
+        include_witnesses, include_notes, include_pedigree_collapse).
+        progress, if given, is called as progress(done, total, result)
+        after each person. If store_path is given, the run is
+        incremental: dependency records are kept in that file, and people
+        whose bios are up to date are skipped.
+        """
+        if bool(output_dir) == bool(jsonl_file):
+            raise ValueError("Specify exactly one of output_dir or jsonl_file")
+
+        self.db_path = db_path
+        self.handles = list(handles)
+        self.output_dir = output_dir
+        self.jsonl_file = jsonl_file
+        self.workers = workers or os.cpu_count() or 1
+        self.progress = progress
+        self.options = options
+        self.store = DependencyStore(store_path) if store_path else None
+
+        self.errors = []
+        self.written = 0
+        self.skipped = 0
+        self.rebuilt = 0
+        self.elapsed = 0.0
+
+
+    def run(self):
+        """
+        Run the export, and return the summary.
+        """
+        start = time.perf_counter()
+        stream = None
+        self.old_stream = None
+        self.old_offsets = {}
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        else:
+            # Bios of unchanged people are copied from the previous file,
+            # which is replaced once the new one is complete
+            if self.store and os.path.exists(self.jsonl_file):
+                self.old_offsets = jsonl_offsets(self.jsonl_file)
+                self.old_stream = open(self.jsonl_file, 'rb')
+            tmp_path = '%s.%d.tmp' % (self.jsonl_file, os.getpid())
+            stream = open(tmp_path, 'w', encoding='utf-8')
+
+        completed = False
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     initializer=_init_worker,
+                                     initargs=(self.db_path, self.options)) \
+                    as executor:
+                futures = [executor.submit(_generate_one, handle,
+                                           self.previous_record(handle))
+                           for handle in self.handles]
+                for done, future in enumerate(as_completed(futures), 1):
+                    result = future.result()
+                    self.write_result(result, stream)
+                    if self.progress:
+                        self.progress(done, len(self.handles), result)
+            completed = True
+        finally:
+            if self.old_stream:
+                self.old_stream.close()
+            if stream:
+                stream.close()
+                if completed:
+                    os.replace(tmp_path, self.jsonl_file)
+                else:
+                    os.remove(tmp_path)
+            if self.store:
+                self.store.save()
+
+        self.elapsed = time.perf_counter() - start
+        return self.summary()
+
+
+    def previous_record(self, person_handle):
+        """
+        The dependency record of a person's last bio, if that bio can be
+        kept: it is still in the JSONL file, or its bio file still exists.
+        """
+        if not self.store:
+            return None
+        record = self.store.get(person_handle)
+        if not record:
+            return None
+        if self.output_dir:
+            name = output_name(dict(record, handle=person_handle))
+            if not os.path.exists(os.path.join(self.output_dir, name)):
+                return None
+        elif person_handle not in self.old_offsets:
+            return None
+        return record
+
+
+    def write_result(self, result, stream):
+        """
+        Write one result. Failures are recorded, and also written to the
+        JSONL stream. The bio files of skipped people are left as they
+        are; in the JSONL stream their previous line is copied through.
+        """
+        if result['error']:
+            self.errors.append(result)
+            if self.store:
+                self.store.put(result['handle'], None)
+        elif result['skipped']:
+            self.skipped += 1
+        else:
+            self.rebuilt += 1
+            if self.store:
+                self.store.put(result['handle'], result['record'])
+
+        result.pop('record', None)
+        if stream and result['skipped']:
+            self.old_stream.seek(self.old_offsets[result['handle']])
+            stream.write(self.old_stream.readline().decode('utf-8'))
+        elif stream:
+            stream.write(json.dumps(result) + "\n")
+        elif not result['error'] and not result['skipped']:
+            path = os.path.join(self.output_dir, output_name(result))
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(result['bio'])
+
+        if not result['error'] and not result['skipped']:
+            self.written += 1
+
+
+    def summary(self):
+        """
+        Counts and throughput of the last run.
+        """
+        total = len(self.handles)
+        return {'people': total,
+                'written': self.written,
+                'errors': len(self.errors),
+                'skipped': self.skipped,
+                'rebuilt': self.rebuilt,
+                'workers': self.workers,
+                'seconds': round(self.elapsed, 3),
+                'bios_per_second': round(self.rebuilt / self.elapsed, 2) \
+                                   if self.elapsed else 0.0}
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Generate WikiTree bios for many people.")
+    parser.add_argument('tree', help="family tree directory")
+    parser.add_argument('--filter', help="name of a custom person filter "
+                        "(default: everyone with a WikiTree id)")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--output', help="directory for one file per person")
+    group.add_argument('--jsonl', help="file for a single JSONL stream")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--incremental', action='store_true',
+                        help="skip people whose bios are up to date")
+    parser.add_argument('--no-witness-events', action='store_true')
+    parser.add_argument('--no-witnesses', action='store_true')
+    parser.add_argument('--no-notes', action='store_true')
+    parser.add_argument('--pedigree-collapse', action='store_true',
+                        help="include the pedigree collapse section")
+    args = parser.parse_args(argv)
+
+    db = open_database_readonly(args.tree)
+    try:
+        handles = find_linked_people(db, args.filter)
+    finally:
+        db.close()
+
+    def progress(done, total, result):
+        status = 'ERROR' if result['error'] \
+                 else 'skipped' if result['skipped'] else 'ok'
+        sys.stderr.write("\r%d/%d %s %s" % (done, total,
+                                            result['id'] or result['handle'],
+                                            status))
+
+    store_path = None
+    if args.incremental:
+        store_path = os.path.join(args.output, '.bio-dependencies.json') \
+                     if args.output else args.jsonl + '.dependencies.json'
+
+    export = BatchExport(args.tree, handles,
+                         output_dir=args.output, jsonl_file=args.jsonl,
+                         workers=args.workers, progress=progress,
+                         store_path=store_path,
+                         include_witness_events=not args.no_witness_events,
+                         include_witnesses=not args.no_witnesses,
+                         include_notes=not args.no_notes,
+                         include_pedigree_collapse=args.pedigree_collapse)
+    summary = export.run()
+    sys.stderr.write("\n")
+    for result in export.errors:
+        sys.stderr.write("%s: %s\n" % (result['handle'], result['error']))
+    print(json.dumps(summary))
+    return 1 if export.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Measure the bytes and time saved by requesting only the fields the
+gramplet uses from the WikiTree API.
+
+For each profile, makes each of the gramplet's requests twice, once with
+all fields and formats and once with the gramplet's field sets, and
+reports the bytes received and the mean time of each. Needs network
+access to the WikiTree API.
+
+Usage:
+    python benchmarks/bench_api.py [--repeat N] [WIKITREE_ID ...]
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Other gramplet modules
+from metrics import MetricsRegistry
+from wikitreeapi import (WikiTreeApi, PERSON_FIELDS, RELATIVES_FIELDS,
+                         BIO_FORMAT)
+
+
+
+DEFAULT_IDS = ('Windsor-1', 'Churchill-4')
+
+# (name, action, parameters for a key, all fields, projected fields)
+REQUESTS = (
+    ('view relatives', 'getRelatives',
+     lambda key: {'keys': key, 'getParents': '1', 'getSpouses': '1',
+                  'getChildren': '1', 'getSiblings': '0'},
+     {}, {'fields': RELATIVES_FIELDS}),
+    ('view bio', 'getBio',
+     lambda key: {'key': key},
+     {'bioFormat': 'both'}, {'bioFormat': BIO_FORMAT}),
+    ('crawl ancestors', 'getAncestors',
+     lambda key: {'key': key, 'depth': 4},
+     {}, {'fields': PERSON_FIELDS}),
+    ('crawl descendants', 'getDescendants',
+     lambda key: {'key': key, 'depth': 4},
+     {}, {'fields': PERSON_FIELDS}),
+)
+
+
+
+def measure(ids, repeat):
+    """
+    Returns a list of (name, (bytes, mean seconds) with all fields,
+    (bytes, mean seconds) projected).
+    """
+    results = []
+    for name, action, params, full, projected in REQUESTS:
+        row = [name]
+        for extra in (full, projected):
+            metrics = MetricsRegistry()
+            api = WikiTreeApi(metrics=metrics)
+            for key in ids:
+                for _ in range(repeat):
+                    api.call(action, use_cache=False, **params(key), **extra)
+            (_, requests, mean, _, received, _, _), = metrics.summary_rows()
+            row.append((received // repeat, mean))
+        results.append(tuple(row))
+    return results
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Measure the savings of requesting fewer fields.")
+    parser.add_argument('ids', nargs='*', default=DEFAULT_IDS,
+                        help="WikiTree ids of the profiles to request")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="requests of each kind per profile")
+    args = parser.parse_args(argv)
+
+    print("%-18s %12s %12s %7s %10s %10s"
+          % ('request', 'all bytes', 'bytes', 'saved', 'all ms', 'ms'))
+    for name, (full_bytes, full_seconds), (bytes_, seconds) \
+            in measure(args.ids, args.repeat):
+        saved = 1 - bytes_ / full_bytes if full_bytes else 0.0
+        print("%-18s %12d %12d %6.0f%% %10.1f %10.1f"
+              % (name, full_bytes, bytes_, saved * 100,
+                 full_seconds * 1000, seconds * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
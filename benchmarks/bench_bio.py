@@ -0,0 +1,188 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Benchmark the bio section formatters on a synthetic tree.
+
+For each section formatter, reports the time and the number of database
+calls per bio, and compares them with a stored baseline. Database call
+counts are deterministic for a given tree and must not grow; times may
+grow by at most the given tolerance. Runs headless.
+
+Usage:
+    python benchmarks/bench_bio.py [--tree DIR] [--people N] [--sample N]
+                                   [--baseline FILE] [--update-baseline]
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.db.utils import make_database, get_dbid_from_path
+
+
+# Other gramplet modules
+from biogenerator import BioGenerator
+from profiling import CountingDb
+from synthetic import create_tree
+
+
+
+# Formatters timed, in the order BioGenerator calls them
+SECTIONS = ('format_summary', 'format_names', 'format_events',
+            'format_notes', 'format_sources')
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'baseline.json')
+
+
+
+def open_tree(path, people, seed):
+    """
+    Open the synthetic tree at path, creating it first if needed.
+    """
+    if os.path.exists(path):
+        db = make_database(get_dbid_from_path(path))
+        db.load(path, None)
+        return db
+    return create_tree(path, seed, people=people)
+
+
+def run_benchmark(db, sample, seed):
+    """
+    Time each section formatter over a sample of people. Returns a dict
+    of section -> {'seconds': per bio, 'db_calls': per bio}.
+    """
+    # Handles are random; Gramps ids are the same in every generated tree
+    handles = [person.get_handle() for person in
+               sorted(db.iter_people(), key=lambda p: p.get_gramps_id())]
+    handles = random.Random(seed).sample(handles, min(sample, len(handles)))
+
+    counting_db = CountingDb(db)
+    seconds = dict.fromkeys(SECTIONS, 0.0)
+    calls = dict.fromkeys(SECTIONS, 0)
+    for handle in handles:
+        person = counting_db.get_person_from_handle(handle)
+        generator = BioGenerator(counting_db, person, include_witness_events=True,
+                                 include_witnesses=True, include_notes=True)
+        generator.prepare()
+        for section in SECTIONS:
+            counting_db.reset()
+            start = time.perf_counter()
+            getattr(generator, section)()
+            seconds[section] += time.perf_counter() - start
+            calls[section] += counting_db.total()
+
+    n = len(handles)
+    return {section: {'seconds': seconds[section] / n,
+                      'db_calls': calls[section] / n}
+            for section in SECTIONS}
+
+
+def run_params(args):
+    """
+    The options the database call counts depend on.
+    """
+    return {'people': args.people, 'seed': args.seed, 'sample': args.sample}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return a list of regressions against the baseline.
+    """
+    regressions = []
+    for section, result in results.items():
+        base = baseline.get(section)
+        if not base:
+            continue
+        if result['db_calls'] > base['db_calls']:
+            regressions.append("%s: %.1f db calls per bio, baseline %.1f"
+                               % (section, result['db_calls'], base['db_calls']))
+        if 'seconds' in base \
+                and result['seconds'] > base['seconds'] * (1 + tolerance):
+            regressions.append("%s: %.2f ms per bio, baseline %.2f ms"
+                               % (section, result['seconds'] * 1000,
+                                  base['seconds'] * 1000))
+    return regressions
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Benchmark the bio section formatters.")
+    parser.add_argument('--tree', help="synthetic tree directory; created "
+                        "if missing (default: a temporary directory)")
+    parser.add_argument('--people', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sample', type=int, default=200,
+                        help="number of bios to time")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed relative slowdown (default 0.25)")
+    args = parser.parse_args(argv)
+
+    path = args.tree or os.path.join(tempfile.mkdtemp(), 'tree')
+    db = open_tree(path, args.people, args.seed)
+    try:
+        results = run_benchmark(db, args.sample, args.seed)
+    finally:
+        db.close()
+
+    for section, result in results.items():
+        print("%-16s %9.3f ms %9.1f db calls per bio"
+              % (section, result['seconds'] * 1000, result['db_calls']))
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(results, params=run_params(args)), f, indent=2,
+                      sort_keys=True)
+        print("Baseline written to %s" % args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at %s; run with --update-baseline" % args.baseline)
+        return 1
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    params = baseline.pop('params', None)
+    if params and params != run_params(args):
+        print("The baseline was made with %s; run with the same options, "
+              "or with --update-baseline" % params)
+        return 1
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
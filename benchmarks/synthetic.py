@@ -0,0 +1,326 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Generate a reproducible synthetic Gramps family tree for benchmarks.
+
+The same size parameters and seed always give the same tree: people
+with several families and many children, witnessed events, citations
+with media and notes on events and names, person notes, and deep place
+hierarchies.
+
+Usage:
+    python benchmarks/synthetic.py TREE_DIR [--people N] [--seed S] ...
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import argparse
+import json
+import os
+import random
+import sys
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.db import DbTxn
+from gramps.gen.db.utils import make_database
+from gramps.gen.lib import (Person, Name, Surname, Family, ChildRef, Event,
+                            EventType, EventRef, EventRoleType, Date, Place,
+                            PlaceName, PlaceRef, PlaceType, Source, Citation,
+                            Media, MediaRef, Note, NoteType, Attribute,
+                            AttributeType)
+
+
+
+# Default size of the generated tree
+DEFAULT_SIZE = {'people': 2000,
+                'families_per_person': 3,
+                'children_per_family': 6,
+                'witness_events': 4,
+                'citations_per_event': 2,
+                'citations_per_name': 1,
+                'notes_per_person': 2,
+                'media_per_citation': 2,
+                'notes_per_citation': 2,
+                'sources': 200,
+                'place_depth': 6,
+                'places_per_level': 4,
+                'linked_fraction': 0.5}
+
+FIRST_NAMES = ('Anna', 'Maria', 'Elisabeth', 'Johann', 'Peter', 'Jacob',
+               'Catharina', 'Hendrik', 'Margaretha', 'Willem', 'Sara', 'Adam')
+SURNAMES = ('Boldt', 'Smith', 'Jansen', 'Muller', 'de Vries', 'Brown',
+            'Schmidt', 'Bakker', 'Wilson', 'Visser', 'Fischer', 'Taylor')
+
+
+
+#====================================================
+#
+# Class SyntheticTree
+#
+#====================================================
+
+class SyntheticTree:
+    """
+    Builder for one synthetic tree, inside a single transaction.
+    """
+
+    def __init__(self, db, trans, size, seed):
+        """
+        """
+        self.db = db
+        self.trans = trans
+        self.size = size
+        self.rand = random.Random(seed)
+        self.leaf_places = []
+        self.source_handles = []
+
+
+    def build(self):
+        self.add_places()
+        self.add_sources()
+        people = self.add_people()
+        self.add_families(people)
+        self.add_witnesses(people)
+        for person in people:
+            self.db.commit_person(person, self.trans)
+
+
+    def add_places(self):
+        """
+        A tree of places, place_depth levels deep. Events happen in the
+        places of the deepest level.
+        """
+        level = [None]
+        for depth in range(self.size['place_depth']):
+            next_level = []
+            for parent_handle in level:
+                for i in range(self.size['places_per_level']):
+                    place = Place()
+                    name = PlaceName()
+                    name.set_value('Place %d.%d.%d' % (depth, len(next_level), i))
+                    place.set_name(name)
+                    place.set_type(PlaceType.CITY if depth else PlaceType.COUNTRY)
+                    if parent_handle:
+                        placeref = PlaceRef()
+                        placeref.ref = parent_handle
+                        place.add_placeref(placeref)
+                    next_level.append(self.db.add_place(place, self.trans))
+            level = next_level
+        self.leaf_places = level
+
+
+    def add_sources(self):
+        for i in range(self.size['sources']):
+            source = Source()
+            source.set_title('Source %d' % i)
+            self.source_handles.append(self.db.add_source(source, self.trans))
+
+
+    def add_citations(self, obj, count):
+        """
+        Add count citations, each with media and notes, to an object.
+        """
+        for i in range(count):
+            citation = Citation()
+            citation.set_reference_handle(self.rand.choice(self.source_handles))
+            citation.set_page('Page %d' % self.rand.randint(1, 999))
+            for j in range(self.size['media_per_citation']):
+                media = Media()
+                media.set_path('/media/scan%06d.jpg' % self.rand.randint(0, 999999))
+                media.set_description('Scan %d' % j)
+                mediaref = MediaRef()
+                mediaref.set_reference_handle(self.db.add_media(media, self.trans))
+                citation.add_media_reference(mediaref)
+            for j in range(self.size['notes_per_citation']):
+                note = Note()
+                note.set("Transcription %d\nline two\nline three" % j)
+                note.set_type(NoteType.CITATION)
+                citation.add_note(self.db.add_note(note, self.trans))
+            obj.add_citation(self.db.add_citation(citation, self.trans))
+
+
+    def add_event(self, event_type, year):
+        """
+        Add an event, and return its handle.
+        """
+        event = Event()
+        event.set_type(event_type)
+        date = Date()
+        date.set_yr_mon_day(year, self.rand.randint(1, 12),
+                            self.rand.randint(1, 28))
+        event.set_date_object(date)
+        event.set_place_handle(self.rand.choice(self.leaf_places))
+        self.add_citations(event, self.size['citations_per_event'])
+        return self.db.add_event(event, self.trans)
+
+
+    def add_event_ref(self, person, event_handle, role=EventRoleType.PRIMARY):
+        event_ref = EventRef()
+        event_ref.set_reference_handle(event_handle)
+        event_ref.set_role(role)
+        person.add_event_ref(event_ref)
+        return event_ref
+
+
+    def add_people(self):
+        people = []
+        for i in range(self.size['people']):
+            person = Person()
+            person.set_gender(Person.MALE if i % 2 == 0 else Person.FEMALE)
+
+            name = Name()
+            name.set_first_name(self.rand.choice(FIRST_NAMES))
+            surname = Surname()
+            surname.set_surname(self.rand.choice(SURNAMES))
+            name.add_surname(surname)
+            self.add_citations(name, self.size['citations_per_name'])
+            person.set_primary_name(name)
+
+            for j in range(self.size['notes_per_person']):
+                note = Note()
+                note.set("Research note %d\nline two" % j)
+                note.set_type(NoteType.PERSON)
+                person.add_note(self.db.add_note(note, self.trans))
+
+            birth_year = 1600 + self.rand.randint(0, 300)
+            ref = self.add_event_ref(person,
+                                     self.add_event(EventType.BIRTH, birth_year))
+            person.set_birth_ref(ref)
+            ref = self.add_event_ref(person,
+                                     self.add_event(EventType.DEATH,
+                                                    birth_year + self.rand.randint(1, 90)))
+            person.set_death_ref(ref)
+
+            if self.rand.random() < self.size['linked_fraction']:
+                attr = Attribute()
+                attr.set_type((AttributeType.CUSTOM, 'WikiTree'))
+                attr.set_value(json.dumps({'id': 'Synthetic-%d' % (i+1),
+                                           'owner': 0}))
+                person.add_attribute(attr)
+
+            self.db.add_person(person, self.trans)
+            people.append(person)
+        return people
+
+
+    def add_families(self, people):
+        """
+        Each man gets several wives, each family several children. Children
+        are drawn from the people who do not have parents yet.
+        """
+        men = people[0::2]
+        women = people[1::2]
+        orphans = list(people)
+        self.rand.shuffle(orphans)
+
+        for father in men:
+            for i in range(self.size['families_per_person']):
+                mother = self.rand.choice(women)
+                family = Family()
+                family.set_father_handle(father.get_handle())
+                family.set_mother_handle(mother.get_handle())
+
+                event_ref = EventRef()
+                event_ref.set_reference_handle(
+                        self.add_event(EventType.MARRIAGE,
+                                       1600 + self.rand.randint(0, 300)))
+                event_ref.set_role(EventRoleType.FAMILY)
+                family.add_event_ref(event_ref)
+
+                children = []
+                for j in range(self.size['children_per_family']):
+                    while orphans:
+                        child = orphans.pop()
+                        if child is not father and child is not mother:
+                            children.append(child)
+                            break
+
+                for child in children:
+                    child_ref = ChildRef()
+                    child_ref.set_reference_handle(child.get_handle())
+                    family.add_child_ref(child_ref)
+
+                family_handle = self.db.add_family(family, self.trans)
+                father.add_family_handle(family_handle)
+                mother.add_family_handle(family_handle)
+                for child in children:
+                    child.add_parent_family_handle(family_handle)
+
+
+    def add_witnesses(self, people):
+        """
+        Make everybody a witness at the births of some other people.
+        """
+        for person in people:
+            for i in range(self.size['witness_events']):
+                other = self.rand.choice(people)
+                if other is person:
+                    continue
+                self.add_event_ref(person, other.get_birth_ref().ref,
+                                   EventRoleType.WITNESS)
+
+
+
+def create_tree(path, seed=1, **size):
+    """
+    Create a synthetic tree in the (new) directory path, and return the
+    open database.
+    """
+    params = dict(DEFAULT_SIZE)
+    params.update(size)
+
+    os.makedirs(path)
+    with open(os.path.join(path, 'database.txt'), 'w') as f:
+        f.write('sqlite')
+    with open(os.path.join(path, 'name.txt'), 'w') as f:
+        f.write('Synthetic %d people, seed %d' % (params['people'], seed))
+
+    db = make_database('sqlite')
+    db.load(path, None)
+    with DbTxn("Synthetic tree", db, batch=True) as trans:
+        SyntheticTree(db, trans, params, seed).build()
+    return db
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Create a synthetic family tree for benchmarks.")
+    parser.add_argument('tree', help="directory to create")
+    parser.add_argument('--seed', type=int, default=1)
+    for key, value in DEFAULT_SIZE.items():
+        parser.add_argument('--' + key.replace('_', '-'), type=type(value),
+                            default=value)
+    args = vars(parser.parse_args(argv))
+    path = args.pop('tree')
+    seed = args.pop('seed')
+
+    db = create_tree(path, seed, **args)
+    print("%d people, %d families, %d events, %d citations"
+          % (db.get_number_of_people(), db.get_number_of_families(),
+             db.get_number_of_events(), db.get_number_of_citations()))
+    db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
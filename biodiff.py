@@ -0,0 +1,231 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from bisect import bisect_left
+from difflib import SequenceMatcher
+import hashlib
+import re
+
+
+
+# Status of a section
+UNCHANGED = 'unchanged'
+CHANGED = 'changed'
+ADDED = 'added'         # only in the generated bio
+REMOVED = 'removed'     # only in the WikiTree bio
+
+# Gaps between anchor lines up to this size are diffed with difflib
+SMALL_GAP = 200
+
+_HEADING = re.compile(r'^(=+)\s*(.*?)\s*\1\s*$')
+
+
+
+def split_sections(text):
+    """
+    Split wikitext at its headings. Returns a list of (title, lines),
+    where the first section has the title '' and holds the lines before
+    the first heading. Trailing spaces are ignored.
+    """
+    sections = [('', [])]
+    for line in (text or '').splitlines():
+        line = line.rstrip()
+        match = _HEADING.match(line)
+        if match:
+            sections.append((match.group(2), [line]))
+        else:
+            sections[-1][1].append(line)
+    if not sections[0][1]:
+        del sections[0]
+    return sections
+
+
+def section_hash(lines):
+    return hashlib.sha1("\n".join(lines).encode('utf-8')).digest()
+
+
+def diff_lines(a, b):
+    """
+    Line diff of two lists of lines, as difflib opcodes
+    (tag, i1, i2, j1, j2).
+
+    Lines are matched first on the lines that occur once in each list,
+    in order ("patience diff"), which takes O(n log n). Only the small
+    gaps left between these anchors are diffed with difflib.
+    """
+    opcodes = []
+    _diff(a, 0, len(a), b, 0, len(b), opcodes)
+
+    # Merge neighbouring opcodes with the same tag
+    merged = []
+    for op in opcodes:
+        if merged and merged[-1][0] == op[0]:
+            last = merged[-1]
+            merged[-1] = (op[0], last[1], op[2], last[3], op[4])
+        else:
+            merged.append(op)
+    return merged
+
+
+def _diff(a, alo, ahi, b, blo, bhi, opcodes):
+    # Common lines at the start and end
+    start_a, start_b = alo, blo
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    if alo > start_a:
+        opcodes.append(('equal', start_a, alo, start_b, blo))
+    end_a, end_b = ahi, bhi
+    while ahi > alo and bhi > blo and a[ahi-1] == b[bhi-1]:
+        ahi -= 1
+        bhi -= 1
+
+    if alo == ahi or blo == bhi:
+        _change(alo, ahi, blo, bhi, opcodes)
+    else:
+        anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+        if anchors:
+            i, j = alo, blo
+            for ai, bj in anchors:
+                _diff(a, i, ai, b, j, bj, opcodes)
+                opcodes.append(('equal', ai, ai + 1, bj, bj + 1))
+                i, j = ai + 1, bj + 1
+            _diff(a, i, ahi, b, j, bhi, opcodes)
+        elif (ahi - alo) + (bhi - blo) <= SMALL_GAP:
+            matcher = SequenceMatcher(None, a[alo:ahi], b[blo:bhi],
+                                      autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                opcodes.append((tag, alo + i1, alo + i2, blo + j1, blo + j2))
+        else:
+            _change(alo, ahi, blo, bhi, opcodes)
+
+    if ahi < end_a:
+        opcodes.append(('equal', ahi, end_a, bhi, end_b))
+
+
+def _change(alo, ahi, blo, bhi, opcodes):
+    if alo < ahi and blo < bhi:
+        opcodes.append(('replace', alo, ahi, blo, bhi))
+    elif alo < ahi:
+        opcodes.append(('delete', alo, ahi, blo, bhi))
+    elif blo < bhi:
+        opcodes.append(('insert', alo, ahi, blo, bhi))
+
+
+def _unique_anchors(a, alo, ahi, b, blo, bhi):
+    """
+    The longest increasing run of (i, j) pairs of lines that occur once
+    in a[alo:ahi] and once in b[blo:bhi].
+    """
+    counts = {}
+    for i in range(alo, ahi):
+        line = a[i]
+        count, _ = counts.get(line, (0, None))
+        counts[line] = (count + 1, i)
+    pairs = {}
+    for j in range(blo, bhi):
+        line = b[j]
+        entry = counts.get(line)
+        if entry is None or entry[0] != 1:
+            continue
+        if line in pairs:
+            pairs[line] = None
+        else:
+            pairs[line] = (entry[1], j)
+    pairs = sorted(p for p in pairs.values() if p)
+
+    # Longest increasing subsequence of j, by patience sorting
+    tails = []          # smallest last j of a run of each length
+    tail_index = []
+    previous = []
+    for k, (i, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+        previous.append(tail_index[pos-1] if pos else -1)
+    result = []
+    k = tail_index[-1] if tail_index else -1
+    while k >= 0:
+        result.append(pairs[k])
+        k = previous[k]
+    result.reverse()
+    return result
+
+
+
+#====================================================
+#
+# Class BioDiff
+#
+#====================================================
+
+class BioDiff:
+    """
+    Section and line diff between a generated biography and the one on
+    WikiTree.
+
+    Sections are paired by title. Sections whose text hashes are equal
+    are unchanged and not diffed further; only the changed sections get
+    a line diff.
+    """
+
+    def __init__(self, generated, current):
+        """
+        """
+        self.generated = split_sections(generated)
+        self.current = split_sections(current)
+
+
+    def compare(self):
+        """
+        List of (title, status, generated lines, current lines, opcodes),
+        in the order of the generated bio, followed by the sections only
+        on WikiTree. The opcodes are for the line diff from the current
+        to the generated lines, and are empty for unchanged sections.
+        """
+        # Title -> current sections with that title, in order
+        current = {}
+        for title, lines in self.current:
+            current.setdefault(title, []).append(lines)
+
+        result = []
+        for title, lines in self.generated:
+            candidates = current.get(title)
+            if not candidates:
+                result.append((title, ADDED, lines, [], []))
+                continue
+            old_lines = candidates.pop(0)
+            if section_hash(old_lines) == section_hash(lines):
+                result.append((title, UNCHANGED, lines, old_lines, []))
+            else:
+                result.append((title, CHANGED, lines, old_lines,
+                               diff_lines(old_lines, lines)))
+
+        for title, lines in self.current:
+            remaining = current.get(title)
+            if remaining and remaining[0] is lines:
+                remaining.pop(0)
+                result.append((title, REMOVED, [], lines, []))
+        return result
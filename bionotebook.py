@@ -0,0 +1,218 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import logging
+import time
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.const import GRAMPS_LOCALE as glocale
+
+#------------------#
+# Gtk modules      #
+#------------------#
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+
+try:
+    gi.require_version('WebKit2', '4.0')
+    from gi.repository import WebKit2
+except:
+    pass
+
+
+# Other gramplet modules
+from renderer import get_renderer, have_html
+from wikitextview import WikiTextView
+from windowpool import new_webview
+
+
+#------------------#
+# Translation      #
+#------------------#
+try:
+    _trans = glocale.get_addon_translator(__file__)
+    _ = _trans.gettext
+except ValueError:
+    _ = glocale.translation.sgettext
+
+
+LOG = logging.getLogger(".WikiTree")
+
+
+
+#====================================================
+#
+# Class BioNotebook
+#
+#====================================================
+
+class BioNotebook(Gtk.Notebook):
+    """
+    Notebook with a "Formatted" (HTML) page, if WebKit2 and the wiki
+    parser are available, and a "WikiCode" page.
+
+    Only the visible page is filled in when the text is set. The other
+    page is filled in the first time it is switched to.
+
+    Text can also be streamed in with begin_wikitext(), append_wikitext()
+    and end_wikitext(). The WikiCode page then fills as the pieces
+    arrive, and the Formatted page is rendered once the text is complete.
+    """
+
+    def __init__(self, name):
+        """
+        name identifies the window in time-to-first-paint log messages.
+        """
+        Gtk.Notebook.__init__(self)
+        self.name = name
+        self.wikitext = ''
+        self.chunks = None
+        self.stale_pages = set()
+        self.paint_start = None
+        self.first_paint = None
+
+        # Do we have all the necessary Python packages?
+        self.html_ok = False
+        try:
+            x = WebKit2
+            self.html_ok = have_html
+        except NameError:
+            pass
+
+        self.html_page = None
+        if self.html_ok:
+            html_window = Gtk.ScrolledWindow()
+            self.webview = new_webview()
+            html_window.add(self.webview)
+            self.html_page = self.append_page(html_window,
+                                              Gtk.Label(label=_("Formatted")))
+
+        self.wikicode_view = WikiTextView()
+        self.wikicode_page = self.append_page(self.wikicode_view,
+                                              Gtk.Label(label=_("WikiCode")))
+
+        self.connect('switch-page', self.on_switch_page)
+
+
+    def set_wikitext(self, wikitext, start=None):
+        """
+        Show new wikitext. start is the time.perf_counter() value from
+        which to measure time to first paint; by default, now.
+        """
+        self.wikitext = wikitext
+        self.chunks = None
+        self.stale_pages = {self.wikicode_page}
+        if self.html_ok:
+            self.stale_pages.add(self.html_page)
+
+        self.paint_start = time.perf_counter() if start is None else start
+        self.first_paint = None
+        self.fill_page(self.get_current_page())
+
+
+    def begin_wikitext(self, start=None):
+        """
+        Start streaming new wikitext.
+        """
+        self.wikitext = ''
+        self.chunks = []
+        self.stale_pages = set()
+        self.paint_start = time.perf_counter() if start is None else start
+        self.first_paint = None
+        self.wikicode_view.clear()
+        if self.get_current_page() == self.wikicode_page:
+            self.wikicode_view.textview.connect_after('draw', self.on_text_draw)
+
+
+    def append_wikitext(self, chunk):
+        """
+        Add a piece of the wikitext being streamed.
+        """
+        self.chunks.append(chunk)
+        self.wikicode_view.append(chunk)
+
+
+    def get_wikitext(self):
+        """
+        The text shown, or streamed so far.
+        """
+        if self.chunks is not None:
+            return ''.join(self.chunks)
+        return self.wikitext
+
+
+    def end_wikitext(self):
+        """
+        The streamed wikitext is complete.
+        """
+        self.wikitext = ''.join(self.chunks)
+        self.chunks = None
+        if self.html_ok:
+            self.stale_pages.add(self.html_page)
+            self.fill_page(self.get_current_page())
+
+
+    def on_switch_page(self, notebook, page, page_num):
+        self.fill_page(page_num)
+
+
+    def fill_page(self, page_num):
+        """
+        Fill in the page, if it does not yet show the current text.
+        """
+        if page_num not in self.stale_pages:
+            return
+        self.stale_pages.discard(page_num)
+
+        if page_num == self.html_page:
+            if self.paint_start is not None:
+                self.webview.connect('load-changed', self.on_load_changed)
+            get_renderer().render_to_webview(self.webview, self.wikitext)
+        else:
+            if self.paint_start is not None:
+                self.wikicode_view.textview.connect_after('draw',
+                                                          self.on_text_draw)
+            self.wikicode_view.set_text(self.wikitext)
+
+
+    def on_load_changed(self, webview, load_event):
+        if load_event == WebKit2.LoadEvent.FINISHED:
+            webview.disconnect_by_func(self.on_load_changed)
+            self.painted()
+
+
+    def on_text_draw(self, textview, context):
+        textview.disconnect_by_func(self.on_text_draw)
+        self.painted()
+
+
+    def painted(self):
+        """
+        Record the time to first paint, once per text.
+        """
+        if self.paint_start is None:
+            return
+        self.first_paint = time.perf_counter() - self.paint_start
+        self.paint_start = None
+        LOG.debug("%s: first paint after %.3f s", self.name, self.first_paint)
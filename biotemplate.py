@@ -0,0 +1,279 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import re
+
+
+# Other gramplet modules
+from snapshot import (load_section, save_section, db_watermark,
+                      iter_change_times)
+
+
+
+# Note types of the template, header and footer notes
+TEMPLATE_NOTE_TYPES = ('WikiTree Template', 'WikiTree Header', 'WikiTree Footer')
+
+SNAPSHOT_SECTION = 'template notes'
+
+# Placeholders a template may use, in the order they must be computed.
+# Sources come after the sections that add citations.
+SECTION_NAMES = ('title', 'summary', 'names', 'events', 'notes',
+                 'pedigree', 'sources', 'lastupdate', 'timestamp')
+
+# A section placeholder, or an escaped '%'
+_TOKEN = re.compile(r'%\((\w+)\)s|%%')
+
+# Compiled templates: note handle -> (note change time, template)
+_cache = {}
+
+# Template note indexes: id(db) -> TemplateNotes
+_template_notes = {}
+
+
+
+class TemplateError(ValueError):
+    """
+    A bio template that cannot be filled.
+    """
+
+
+
+#====================================================
+#
+# Class CompiledTemplate
+#
+#====================================================
+
+class CompiledTemplate:
+    """
+    A bio template, parsed once into literal text and section
+    placeholders. Records which sections it refers to, so only those need
+    to be generated.
+    """
+
+    def __init__(self, text):
+        """
+        Raises TemplateError for unknown placeholders or bad % formats.
+        """
+        self.text = text
+
+        # parts: list of (literal text, None) or (None, section name)
+        self.parts = []
+        literal = []
+        pos = 0
+        for match in _TOKEN.finditer(text):
+            literal.append(text[pos:match.start()])
+            pos = match.end()
+            name = match.group(1)
+            if name is None:
+                literal.append('%')
+                continue
+            if ''.join(literal):
+                self.parts.append((''.join(literal), None))
+            literal = []
+            self.parts.append((None, name))
+        literal.append(text[pos:])
+        if ''.join(literal):
+            self.parts.append((''.join(literal), None))
+
+        names = [name for (lit, name) in self.parts if name]
+        unknown = sorted(set(names) - set(SECTION_NAMES))
+        if unknown:
+            raise TemplateError("Unknown template placeholder(s): %s"
+                                % ', '.join('%%(%s)s' % n for n in unknown))
+
+        # Catch stray '%' characters now, rather than after generation
+        if '%' in _TOKEN.sub('', text):
+            raise TemplateError("Invalid template: stray '%%' in %r"
+                                % _stray_context(text))
+
+        self.sections = tuple(n for n in SECTION_NAMES if n in names)
+
+
+    def __repr__(self):
+        return 'CompiledTemplate(%r)' % self.text
+
+
+    def needs(self, name):
+        """
+        True if the template refers to the named section.
+        """
+        return name in self.sections
+
+
+    def fill(self, values):
+        """
+        Fill in the template. Sections missing from values are left empty.
+        """
+        return ''.join(lit if name is None else values.get(name, '')
+                       for (lit, name) in self.parts)
+
+
+
+def _stray_context(text):
+    """
+    The text around the first '%' that is not part of a placeholder.
+    """
+    pos = 0
+    for match in _TOKEN.finditer(text):
+        stray = text.find('%', pos, match.start())
+        if stray != -1:
+            break
+        pos = match.end()
+    else:
+        stray = text.find('%', pos)
+    return text[max(0, stray-10):stray+10]
+
+
+
+def compile_template(text, note=None):
+    """
+    Return the compiled template for the text. If the text comes from a
+    note, the compiled template is cached for that revision of the note.
+    """
+    if note is None:
+        return CompiledTemplate(text)
+    handle = note.get_handle()
+    change = note.get_change_time()
+    cached = _cache.get(handle)
+    if cached is None or cached[0] != change:
+        cached = (change, CompiledTemplate(text))
+        _cache[handle] = cached
+    return cached[1]
+
+
+
+def get_template_notes(db):
+    """
+    The template note index for a database, loaded or built on first use.
+    """
+    notes = _template_notes.get(id(db))
+    if notes is None or notes.db is not db:
+        _template_notes.clear()
+        notes = _template_notes[id(db)] = TemplateNotes(db)
+    return notes
+
+
+def template_notes_changed(db, note_handles):
+    """
+    Notes were added, changed or deleted: update the template note index,
+    if it is loaded.
+    """
+    notes = _template_notes.get(id(db))
+    if notes is not None and notes.db is db:
+        notes.update_handles(note_handles)
+
+
+
+#====================================================
+#
+# Class TemplateNotes
+#
+#====================================================
+
+class TemplateNotes:
+    """
+    The handles of the template, header and footer notes of a database,
+    so they can be found without reading every note. Kept in a snapshot
+    between sessions, like the link index.
+    """
+
+    def __init__(self, db):
+        """
+        """
+        self.db = db
+        self.types = {}         # note handle -> note type
+        self.max_change = 0
+        self.covered = set()    # handles of all the notes seen
+
+        section = load_section(db, SNAPSHOT_SECTION)
+        if section is None:
+            self.refresh()
+        else:
+            self.types = section['data']
+            self.max_change = section['max_change']
+            self.covered = set(section['handles'])
+            if section['watermark'] != db_watermark(db):
+                self.refresh(section['max_change'])
+            else:
+                return
+        save_section(db, SNAPSHOT_SECTION, self.max_change, self.covered,
+                     self.types)
+
+
+    def refresh(self, since=None):
+        """
+        Read the notes changed after since, or all notes. When since is
+        given, only the changed notes, and those not seen before, are
+        read.
+        """
+        seen = set()
+        if since is None:
+            for note in self.db.iter_notes():
+                seen.add(note.get_handle())
+                self.max_change = max(self.max_change, note.get_change_time())
+                self.update_note(note)
+        else:
+            for handle, change in iter_change_times(self.db, 'Note'):
+                seen.add(handle)
+                if change < since and handle in self.covered:
+                    continue
+                self.max_change = max(self.max_change, change)
+                self.update_note(self.db.get_note_from_handle(handle))
+        for handle in set(self.types) - seen:
+            del self.types[handle]
+        self.covered = seen
+
+
+    def update_note(self, note):
+        note_type = note.get_type().string
+        if note_type in TEMPLATE_NOTE_TYPES:
+            self.types[note.get_handle()] = note_type
+        else:
+            self.types.pop(note.get_handle(), None)
+
+
+    def update_handles(self, note_handles):
+        """
+        Update the index for notes added, changed or deleted in this
+        session, and save it if the templates changed.
+        """
+        old_types = dict(self.types)
+        for handle in note_handles:
+            note = self.db.get_note_from_handle(handle) \
+                   if self.db.has_note_handle(handle) else None
+            if note:
+                self.covered.add(handle)
+                self.max_change = max(self.max_change, note.get_change_time())
+                self.update_note(note)
+            else:
+                self.covered.discard(handle)
+                self.types.pop(handle, None)
+        if self.types != old_types:
+            save_section(self.db, SNAPSHOT_SECTION, self.max_change,
+                         self.covered, self.types)
+
+
+    def handles(self):
+        """
+        (note handle, note type) for each template, header or footer note.
+        """
+        return list(self.types.items())
@@ -0,0 +1,163 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+#====================================================
+#
+# Class CitationRegistry
+#
+#====================================================
+
+class CitationRegistry:
+    """
+    Registry of the sources and citations referenced by a biography.
+
+    Sources are numbered in order of first use, and citations within a
+    source are lettered in order of first use. Citation, source, media
+    and note objects are loaded at most once.
+    """
+
+    def __init__(self, db):
+        """
+        """
+        self.db = db
+
+        # source handle -> {'num', 'src', 'citation handles', 'citation index'}
+        self.sources = {}
+
+        # Object caches, by handle
+        self.citation_cache = {}
+        self.source_cache = {}
+        self.media_cache = {}
+        self.note_cache = {}
+
+
+    def get_citation(self, handle):
+        citation = self.citation_cache.get(handle)
+        if citation is None:
+            citation = self.db.get_citation_from_handle(handle)
+            self.citation_cache[handle] = citation
+        return citation
+
+
+    def get_source(self, handle):
+        source = self.source_cache.get(handle)
+        if source is None:
+            source = self.db.get_source_from_handle(handle)
+            self.source_cache[handle] = source
+        return source
+
+
+    def get_media(self, handle):
+        media = self.media_cache.get(handle)
+        if media is None:
+            media = self.db.get_media_from_handle(handle)
+            self.media_cache[handle] = media
+        return media
+
+
+    def get_note(self, handle):
+        note = self.note_cache.get(handle)
+        if note is None:
+            note = self.db.get_note_from_handle(handle)
+            self.note_cache[handle] = note
+        return note
+
+
+    def prefetch(self, citation_handles=None, include_notes=False):
+        """
+        Load, in one pass per object type, the citations, sources, media
+        and notes needed to render the given citations. With no list
+        given, prefetch everything already registered.
+        """
+        if citation_handles is None:
+            citation_handles = [handle for src in self.sources.values()
+                                for handle in src['citation handles']]
+
+        citations = [self.get_citation(handle)
+                     for handle in dict.fromkeys(citation_handles)]
+
+        source_handles = dict.fromkeys(cit.source_handle for cit in citations)
+        for handle in source_handles:
+            self.get_source(handle)
+
+        media_handles = dict.fromkeys(mediaref.ref for cit in citations
+                                      for mediaref in cit.get_media_list())
+        for handle in media_handles:
+            self.get_media(handle)
+
+        if include_notes:
+            note_handles = dict.fromkeys(handle for cit in citations
+                                         for handle in cit.get_note_list())
+            for handle in note_handles:
+                self.get_note(handle)
+
+
+    def add_citations(self, citations):
+        """
+        Register the citations, and return the footnote markers for them.
+        """
+        res_cit_str = ''
+
+        for cit_handle in citations:
+            citation = self.get_citation(cit_handle)
+            source_handle = citation.source_handle
+
+            src = self.sources.get(source_handle)
+            if src is None:
+                src = {'num': str(len(self.sources)+1),
+                       'src': self.get_source(source_handle),
+                       'citation handles': [],
+                       'citation index': {}}
+                self.sources[source_handle] = src
+
+            index = src['citation index']
+            i = index.get(cit_handle)
+            if i is None:
+                i = len(src['citation handles'])
+                index[cit_handle] = i
+                src['citation handles'].append(cit_handle)
+
+            cit_str = src['num'] + self.get_cit_number(i)
+            res_cit_str += '<sup>[%s]</sup>' % cit_str
+
+        if res_cit_str:
+            res_cit_str = ' ' + res_cit_str
+        return res_cit_str
+
+
+    def get_cit_number(self, n):
+        """
+        Return the letter(s) for the n'th citation of a source.
+        """
+        alpha = 'abcdefghijklmnopqrstuvwxyz'
+        b = 26
+        if n == 0:
+            return 'a'
+        digits = []
+        first = True
+        while n:
+            dig = n%b
+            if not first:
+                dig -= 1
+            digits.append(dig)
+            n //= b
+            first = False
+        digits.reverse()
+        return ''.join([alpha[x] for x in digits])
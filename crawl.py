@@ -0,0 +1,250 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# Other gramplet modules
+from wikitreeapi import get_api, PERSON_FIELDS
+from linkindex import get_link_index
+from familycompare import FamilyComparison, CONFLICT
+
+
+
+ANCESTORS = 'ancestors'
+DESCENDANTS = 'descendants'
+
+# Generations fetched by one getAncestors or getDescendants request
+REQUEST_DEPTH = 4
+
+# Requests in flight at once
+DEFAULT_WORKERS = 4
+
+# Proposed link status
+NEW = 'new'
+LINKED = 'linked'
+
+
+
+#====================================================
+#
+# Class BranchCrawl
+#
+#====================================================
+
+class BranchCrawl:
+    """
+    Fetch the ancestors or descendants of a WikiTree profile, to a given
+    number of generations.
+
+    The branch is fetched breadth first, a few generations per request,
+    with up to `workers` requests in flight. People reached through more
+    than one path are kept once, at their lowest generation, and are only
+    used as the start of a further request once. Uses only the API, so it
+    can run in a background thread.
+    """
+
+    def __init__(self, wikitree_id, direction=ANCESTORS, depth=5,
+                 workers=DEFAULT_WORKERS, api=None):
+        """
+        """
+        self.wikitree_id = wikitree_id
+        self.direction = direction
+        self.depth = depth
+        self.workers = workers
+        self.api = api or get_api()
+
+        self.nodes = {}         # user id -> WikiTree person
+        self.generation = {}    # user id -> generations from the start
+        self.children = {}      # user id -> set of children's user ids
+        self.root = None
+        self.requests = 0
+        self.errors = []
+
+
+    def run(self, progress=None):
+        """
+        Crawl the branch. progress, if given, is called as
+        progress(requests done, people found) after each request.
+        """
+        requested = set()
+        frontier = [(self.wikitree_id, 0)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while frontier:
+                futures = {}
+                for key, gen in frontier:
+                    depth = min(REQUEST_DEPTH, self.depth - gen)
+                    future = executor.submit(self.fetch, key, depth)
+                    futures[future] = (key, gen, depth)
+
+                frontier = []
+                for future in as_completed(futures):
+                    key, gen, depth = futures[future]
+                    self.requests += 1
+                    try:
+                        people = future.result()
+                    except Exception as err:
+                        self.errors.append((key, str(err)))
+                        continue
+                    horizon = gen + depth
+                    for user_id in self.add_people(key, gen, people):
+                        if self.generation[user_id] == horizon \
+                                and horizon < self.depth \
+                                and user_id not in requested \
+                                and self.may_extend(user_id):
+                            requested.add(user_id)
+                            frontier.append((self.nodes[user_id]['Name'],
+                                             horizon))
+                    if progress:
+                        progress(self.requests, len(self.nodes))
+        return self
+
+
+    def fetch(self, key, depth):
+        """
+        Fetch the people within depth generations of key.
+        """
+        action = 'getAncestors' if self.direction == ANCESTORS \
+                 else 'getDescendants'
+        return list(self.api.stream(action, 'item.%s.item' % self.direction,
+                                    key=key, depth=depth, fields=PERSON_FIELDS))
+
+
+    def add_people(self, key, gen, people):
+        """
+        Add the people from one response, whose request started at key,
+        at generation gen. Returns the user ids of the people that are new
+        or now at a lower generation.
+        """
+        by_id = {}
+        children = {}
+        start = None
+        for person in people:
+            user_id = person['Id']
+            by_id[user_id] = person
+            if person.get('Name') == key:
+                start = user_id
+            for parent in (person.get('Father'), person.get('Mother')):
+                if parent:
+                    children.setdefault(parent, set()).add(user_id)
+        if start is None:
+            return []
+
+        for parent, kids in children.items():
+            self.children.setdefault(parent, set()).update(kids)
+        if self.root is None:
+            self.root = start
+
+        # Generations within this response, from its starting person
+        changed = []
+        queue = deque([(start, gen)])
+        seen = {start}
+        while queue:
+            user_id, g = queue.popleft()
+            if g < self.generation.get(user_id, self.depth + 1):
+                self.nodes[user_id] = by_id[user_id]
+                self.generation[user_id] = g
+                changed.append(user_id)
+            for next_id in self.next_ids(by_id[user_id], children):
+                if next_id in by_id and next_id not in seen:
+                    seen.add(next_id)
+                    queue.append((next_id, g + 1))
+        return changed
+
+
+    def next_ids(self, person, children):
+        """
+        The ids of the people one generation further from the start.
+        """
+        if self.direction == ANCESTORS:
+            return [p for p in (person.get('Father'), person.get('Mother')) if p]
+        return children.get(person['Id'], ())
+
+
+    def may_extend(self, user_id):
+        """
+        Whether fetching further from this person can find anyone new.
+        """
+        if self.direction == ANCESTORS:
+            person = self.nodes[user_id]
+            return bool(person.get('Father') or person.get('Mother'))
+        return True
+
+
+    def relatives(self, user_id):
+        """
+        The crawled parents or children of a person.
+        """
+        if self.direction == ANCESTORS:
+            person = self.nodes[user_id]
+            ids = [person.get('Father'), person.get('Mother')]
+        else:
+            ids = self.children.get(user_id, ())
+        return [self.nodes[i] for i in ids if i in self.nodes]
+
+
+
+def match_branch(db, person, crawl):
+    """
+    Walk the crawled branch and the Gramps family of person side by side,
+    pairing each WikiTree parent or child with a Gramps one. Returns a
+    list of proposed links (person handle, WikiTree person, generation,
+    status, notes), where status is NEW, LINKED or CONFLICT.
+    """
+    if crawl.root is None:
+        return []
+    index = get_link_index(db)
+    key, role = ('Parents', 'parent') if crawl.direction == ANCESTORS \
+                else ('Children', 'child')
+
+    proposals = []
+    matched_handles = {person.get_handle()}
+    queue = deque([(crawl.root, person)])
+    while queue:
+        user_id, local_person = queue.popleft()
+        relatives = crawl.relatives(user_id)
+        if not relatives:
+            continue
+        profile = {key: {r['Id']: r for r in relatives}}
+        comparison = FamilyComparison(db, local_person, profile)
+        for row_role, local, remote, status, notes in comparison.compare():
+            if row_role != role or not local or not remote \
+                    or local['handle'] in matched_handles:
+                continue
+            matched_handles.add(local['handle'])
+            linked_handle = index.get_handle(remote['Name'])
+            if local['id'] == remote['Name']:
+                status = LINKED
+            elif local['id']:
+                status = CONFLICT
+            elif linked_handle and linked_handle != local['handle']:
+                status = CONFLICT
+                notes = notes + ['%s is linked to another Gramps person'
+                                 % remote['Name']]
+            else:
+                status = NEW
+            proposals.append((local['handle'], remote,
+                              crawl.generation[remote['Id']], status, notes))
+            if status != CONFLICT:
+                queue.append((remote['Id'],
+                              db.get_person_from_handle(local['handle'])))
+    return proposals
@@ -0,0 +1,194 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import hashlib
+import json
+import os
+import re
+
+
+
+_GETTER = re.compile(r'^get_(\w+)_from_handle$')
+
+
+
+def text_hash(text):
+    """
+    Stable hash of a string.
+    """
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _backlink_key(handle, include_classes):
+    return handle + '|' + ','.join(include_classes or [])
+
+
+def _backlink_hash(backlinks):
+    return text_hash(repr(sorted(tuple(link) for link in backlinks)))
+
+
+
+#====================================================
+#
+# Class TrackingDb
+#
+#====================================================
+
+class TrackingDb:
+    """
+    Database proxy that records every object read through it, with its
+    change time, and every backlink query, with a hash of its result.
+
+    Anything not intercepted is passed straight to the wrapped database.
+    """
+
+    def __init__(self, db):
+        """
+        """
+        self.db = db
+        self.objects = {}       # handle -> (class name, change time)
+        self.backlinks = {}     # backlink key -> hash of result
+
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        match = _GETTER.match(name)
+        if match:
+            attr = self._track_getter(attr, match.group(1).capitalize())
+        elif name == 'find_backlink_handles':
+            attr = self._track_backlinks(attr)
+        else:
+            return attr
+
+        # Cache the wrapper, so __getattr__ is only called once per name
+        setattr(self, name, attr)
+        return attr
+
+
+    def _track_getter(self, getter, class_name):
+        objects = self.objects
+
+        def tracked(handle):
+            obj = getter(handle)
+            if obj is not None and handle not in objects:
+                objects[handle] = (class_name, obj.get_change_time())
+            return obj
+        return tracked
+
+
+    def _track_backlinks(self, find_backlink_handles):
+        backlinks = self.backlinks
+
+        def tracked(handle, include_classes=None):
+            result = list(find_backlink_handles(handle, include_classes))
+            backlinks[_backlink_key(handle, include_classes)] \
+                    = _backlink_hash(result)
+            return iter(result)
+        return tracked
+
+
+    def dependencies(self):
+        """
+        The recorded dependency set, in a JSON-serializable form.
+        """
+        return {'objects': [[class_name, handle, change]
+                            for handle, (class_name, change)
+                            in self.objects.items()],
+                'backlinks': self.backlinks}
+
+
+
+def dependencies_unchanged(db, deps):
+    """
+    True if none of the objects or backlinks in a dependency set recorded
+    by TrackingDb has changed since.
+    """
+    for class_name, handle, change in deps['objects']:
+        getter = getattr(db, 'get_%s_from_handle' % class_name.lower())
+        try:
+            obj = getter(handle)
+        except Exception:
+            # Deleted objects raise HandleError
+            return False
+        if obj is None or obj.get_change_time() != change:
+            return False
+
+    for key, digest in deps['backlinks'].items():
+        handle, classes = key.split('|', 1)
+        include_classes = classes.split(',') if classes else None
+        result = db.find_backlink_handles(handle, include_classes)
+        if _backlink_hash(result) != digest:
+            return False
+
+    return True
+
+
+
+#====================================================
+#
+# Class DependencyStore
+#
+#====================================================
+
+class DependencyStore:
+    """
+    Sidecar JSON file holding, for each person handle, the dependency set
+    and output hash of the last generated bio.
+    """
+
+    def __init__(self, path):
+        """
+        """
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.records = json.load(f)
+
+
+    def get(self, person_handle):
+        return self.records.get(person_handle)
+
+
+    def put(self, person_handle, record):
+        self.records[person_handle] = record
+
+
+    def save(self):
+        """
+        Write the store, atomically replacing the old file.
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.records, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+
+def is_up_to_date(db, record, options, templates_hash):
+    """
+    True if a stored record shows that a bio generated with the same
+    options and templates does not need to be regenerated.
+    """
+    return bool(record) \
+           and record.get('options') == options \
+           and record.get('templates') == templates_hash \
+           and dependencies_unchanged(db, record['deps'])
@@ -0,0 +1,276 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import re
+
+try:
+    import numpy
+    have_numpy = True
+except ImportError:
+    have_numpy = False
+
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.display.name import displayer as name_displayer
+
+
+# Other gramplet modules
+from linkindex import get_link_index
+from sync import get_profile_store
+
+
+
+# Kinds of discrepancy
+DIFFERENT = 'different'
+GRAMPS_ONLY = 'only in Gramps'
+WIKITREE_ONLY = 'only on WikiTree'
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+
+def place_token(name):
+    """
+    Normalized locality of a place: the first part of the name, in lower
+    case, without punctuation or spaces.
+    """
+    return _NON_WORD.sub('', (name or '').split(',')[0].lower())
+
+
+def wikitree_date(date):
+    """
+    (year, yyyymmdd) for a WikiTree date; yyyymmdd is 0 unless the date
+    is complete, and both are 0 if it is unknown.
+    """
+    try:
+        year, month, day = (int(x) for x in (date or '').split('-'))
+    except ValueError:
+        return (0, 0)
+    if month and day:
+        return (year, year * 10000 + month * 100 + day)
+    return (year, 0)
+
+
+def format_ymd(ymd):
+    return '%04d-%02d-%02d' % (ymd // 10000, ymd // 100 % 100, ymd % 100) \
+           if ymd else ''
+
+
+def gramps_date(date):
+    """
+    (year, yyyymmdd) for a Gramps Date; yyyymmdd is 0 unless the date is
+    a regular (exact, complete) date.
+    """
+    year = date.get_year()
+    if date.is_regular():
+        return (year, year * 10000 + date.get_month() * 100 + date.get_day())
+    return (year, 0)
+
+
+
+#====================================================
+#
+# Class DiscrepancyReport
+#
+#====================================================
+
+class DiscrepancyReport:
+    """
+    Compare birth and death dates and places, and parents, of every
+    linked person with the cached copy of their WikiTree profile.
+
+    The Gramps side is read with one pass over each of the events,
+    places, families and people, rather than with lookups per person.
+    Both sides are then put into columns of integers (years, dates,
+    place and parent codes) and compared column by column, with numpy
+    when it is available.
+    """
+
+    # Compared fields: (name, column, kind of column)
+    fields = (('birth year', 'birth_year', 'year'),
+              ('birth date', 'birth_ymd', 'date'),
+              ('birth place', 'birth_place', 'code'),
+              ('death year', 'death_year', 'year'),
+              ('death date', 'death_ymd', 'date'),
+              ('death place', 'death_place', 'code'),
+              ('father', 'father', 'code'),
+              ('mother', 'mother', 'code'))
+
+    def __init__(self, db, store=None):
+        """
+        """
+        self.db = db
+        self.store = store if store is not None else get_profile_store()
+        self.rows = []          # (handle, WikiTree id) per column row
+        self.names = {}         # handle -> displayed name
+        self.local = {}         # column name -> list of ints
+        self.remote = {}
+        self.values = {}        # code -> text, for place and parent codes
+        self.codes = {'': 0}
+
+
+    def code(self, text):
+        """
+        Integer code for a string; 0 for the empty string.
+        """
+        code = self.codes.get(text)
+        if code is None:
+            code = self.codes[text] = len(self.codes)
+            self.values[code] = text
+        return code
+
+
+    def load(self):
+        """
+        Load both sides into columns.
+        """
+        db = self.db
+        index = get_link_index(db)
+        names = {}              # WikiTree user id -> WikiTree id
+        for wikitree_id, profile in self.store.profiles.items():
+            names[profile.get('Id')] = wikitree_id
+
+        places = {}
+        for place in db.iter_places():
+            places[place.get_handle()] = place.get_name().get_value()
+        events = {}
+        for event in db.iter_events():
+            events[event.get_handle()] = (gramps_date(event.get_date_object()),
+                                          places.get(event.get_place_handle(), ''))
+        parents = {}
+        for family in db.iter_families():
+            parents[family.get_handle()] = (family.get_father_handle(),
+                                            family.get_mother_handle())
+
+        columns = [name for (label, name, kind) in self.fields]
+        local = {name: [] for name in columns}
+        remote = {name: [] for name in columns}
+        no_event = ((0, 0), '')
+        for person in db.iter_people():
+            handle = person.get_handle()
+            wikitree_id = index.get_id(handle)
+            profile = self.store.get(wikitree_id) if wikitree_id else None
+            if profile is None:
+                continue
+            self.rows.append((handle, wikitree_id))
+            self.names[handle] = name_displayer.display_name(person.get_primary_name())
+
+            event_refs = person.get_event_ref_list()
+            for prefix, ref_index, date_key, place_key in (
+                    ('birth', person.get_birth_ref_index(), 'BirthDate', 'BirthLocation'),
+                    ('death', person.get_death_ref_index(), 'DeathDate', 'DeathLocation')):
+                (year, ymd), place = events.get(event_refs[ref_index].ref, no_event) \
+                                     if ref_index >= 0 else no_event
+                local[prefix + '_year'].append(year)
+                local[prefix + '_ymd'].append(ymd)
+                local[prefix + '_place'].append(self.code(place_token(place)))
+                year, ymd = wikitree_date(profile.get(date_key))
+                remote[prefix + '_year'].append(year)
+                remote[prefix + '_ymd'].append(ymd)
+                remote[prefix + '_place'].append(
+                        self.code(place_token(profile.get(place_key))))
+
+            father, mother = parents.get(person.get_main_parents_family_handle(),
+                                         (None, None))
+            for key, parent, remote_key in (('father', father, 'Father'),
+                                            ('mother', mother, 'Mother')):
+                # Parents unlinked in Gramps, or not in the profile store,
+                # are only compared with a missing parent
+                parent_id = index.get_id(parent) if parent else ''
+                remote_user = profile.get(remote_key) or 0
+                remote_id = names.get(remote_user, '') if remote_user else ''
+                if parent and remote_user and not (parent_id and remote_id):
+                    parent_id = remote_id = ''
+                elif remote_user and not remote_id:
+                    remote_id = '#%d' % remote_user
+                local[key].append(self.code(parent_id or ''))
+                remote[key].append(self.code(remote_id))
+
+        self.local = local
+        self.remote = remote
+        return self
+
+
+    def compare(self):
+        """
+        Compare the columns, and return a list of discrepancies
+        (handle, WikiTree id, field, kind, Gramps value, WikiTree value,
+        difference), sorted by WikiTree id and field.
+        """
+        result = []
+        for label, name, kind in self.fields:
+            if have_numpy:
+                found = self._compare_numpy(self.local[name], self.remote[name])
+            else:
+                found = self._compare_python(self.local[name], self.remote[name])
+            for row, what in found:
+                local = self.local[name][row]
+                remote = self.remote[name][row]
+                delta = 0
+                if kind == 'date':
+                    # Incomplete dates, and different years, are reported
+                    # as years
+                    year = name.replace('_ymd', '_year')
+                    if what != DIFFERENT \
+                            or self.local[year][row] != self.remote[year][row]:
+                        continue
+                    local, remote = format_ymd(local), format_ymd(remote)
+                elif kind == 'year':
+                    delta = remote - local if what == DIFFERENT else 0
+                else:
+                    local = self.values.get(local, '')
+                    remote = self.values.get(remote, '')
+                handle, wikitree_id = self.rows[row]
+                result.append((handle, wikitree_id, label, what,
+                               str(local or ''), str(remote or ''), delta))
+        result.sort(key=lambda r: (r[1], r[2]))
+        return result
+
+
+    def _compare_numpy(self, local, remote):
+        """
+        (row, kind) for each mismatch between two columns, where 0 means
+        unknown.
+        """
+        local = numpy.asarray(local, dtype=numpy.int64)
+        remote = numpy.asarray(remote, dtype=numpy.int64)
+        local_known = local != 0
+        remote_known = remote != 0
+        found = []
+        for kind, mask in ((DIFFERENT, local_known & remote_known & (local != remote)),
+                           (GRAMPS_ONLY, local_known & ~remote_known),
+                           (WIKITREE_ONLY, remote_known & ~local_known)):
+            found.extend((int(row), kind) for row in numpy.flatnonzero(mask))
+        return found
+
+
+    def _compare_python(self, local, remote):
+        found = []
+        for row, (l, r) in enumerate(zip(local, remote)):
+            if l and r and l != r:
+                found.append((row, DIFFERENT))
+            elif l and not r:
+                found.append((row, GRAMPS_ONLY))
+            elif r and not l:
+                found.append((row, WIKITREE_ONLY))
+        return found
@@ -0,0 +1,267 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.utils.db import (get_birth_or_fallback,
+                                 get_death_or_fallback)
+from gramps.gen.const import GRAMPS_LOCALE as glocale
+
+
+# Other gramplet modules
+from linkindex import get_link_index
+
+
+#------------------#
+# Translation      #
+#------------------#
+try:
+    _trans = glocale.get_addon_translator(__file__)
+    _ = _trans.gettext
+except ValueError:
+    _ = glocale.translation.sgettext
+
+
+
+ROLES = ('parent', 'spouse', 'child')
+
+# Least name/date score for two people to be considered the same
+MIN_MATCH_SCORE = 3
+
+# Results of the comparison
+SAME = 'same'
+CONFLICT = 'conflict'
+MISSING = 'missing'     # on WikiTree, not in Gramps
+EXTRA = 'extra'         # in Gramps, not on WikiTree
+
+
+
+def wikitree_year(date):
+    """
+    Year of a WikiTree date (YYYY-MM-DD), or None if unknown.
+    """
+    try:
+        year = int((date or '')[:4])
+    except ValueError:
+        return None
+    return year or None
+
+
+def _first_word(text):
+    words = (text or '').split()
+    return words[0].lower() if words else ''
+
+
+def remote_relatives(profile):
+    """
+    The relatives of a person in a getRelatives response item, as a list
+    of (role, person dict).
+    """
+    relatives = []
+    for role, key in (('parent', 'Parents'), ('spouse', 'Spouses'),
+                      ('child', 'Children')):
+        for person in (profile.get(key) or {}).values():
+            relatives.append((role, person))
+    return relatives
+
+
+def local_relatives(db, person):
+    """
+    The parents, spouses and children of a Gramps person, as a list of
+    (role, person).
+    """
+    relatives = []
+    family_handle = person.get_main_parents_family_handle()
+    if family_handle:
+        family = db.get_family_from_handle(family_handle)
+        for handle in (family.get_father_handle(), family.get_mother_handle()):
+            if handle:
+                relatives.append(('parent', db.get_person_from_handle(handle)))
+
+    person_handle = person.get_handle()
+    for family_handle in person.get_family_handle_list():
+        family = db.get_family_from_handle(family_handle)
+        if not family:
+            continue
+        for handle in (family.get_father_handle(), family.get_mother_handle()):
+            if handle and handle != person_handle:
+                relatives.append(('spouse', db.get_person_from_handle(handle)))
+        for child_ref in family.get_child_ref_list():
+            relatives.append(('child', db.get_person_from_handle(child_ref.ref)))
+    return relatives
+
+
+
+#====================================================
+#
+# Class FamilyComparison
+#
+#====================================================
+
+class FamilyComparison:
+    """
+    Compare the family of a Gramps person with the relatives of a WikiTree
+    profile. Relatives are paired by WikiTree id where the Gramps person
+    is linked, else by a name and date score. Each row of the result is
+    (role, local summary or None, WikiTree person or None, status, notes).
+    """
+
+    def __init__(self, db, person, profile):
+        """
+        profile is the 'person' of a getRelatives response item, fetched
+        with parents, spouses and children.
+        """
+        self.db = db
+        self.person = person
+        self.profile = profile
+        self.index = get_link_index(db)
+        self.rows = []
+
+
+    def local_summary(self, person):
+        """
+        What the comparison needs to know about a Gramps person.
+        """
+        name = person.get_primary_name()
+        birth = get_birth_or_fallback(self.db, person)
+        death = get_death_or_fallback(self.db, person)
+        return {'handle': person.get_handle(),
+                'id': self.index.get_id(person.get_handle()),
+                'first': name.get_first_name(),
+                'surname': name.get_surname(),
+                'birth': (birth.get_date_object().get_year() or None) if birth else None,
+                'death': (death.get_date_object().get_year() or None) if death else None}
+
+
+    def score(self, local, remote):
+        """
+        How alike a Gramps and a WikiTree person are, by name and dates.
+        """
+        score = 0
+        surname = local['surname'].lower()
+        surnames = ((remote.get('LastNameAtBirth') or '').lower(),
+                    (remote.get('LastNameCurrent') or '').lower())
+        if surname and surname in surnames:
+            score += 2
+        first = _first_word(local['first'])
+        if first and first in (_first_word(remote.get('FirstName')),
+                               _first_word(remote.get('RealName'))):
+            score += 2
+        for key, remote_key in (('birth', 'BirthDate'), ('death', 'DeathDate')):
+            local_year = local[key]
+            remote_year = wikitree_year(remote.get(remote_key))
+            if local_year and remote_year:
+                diff = abs(local_year - remote_year)
+                score += 2 if diff == 0 else 1 if diff <= 2 else -2
+        return score
+
+
+    def compare(self):
+        """
+        Compare the two families, and return the rows.
+        """
+        local = {role: [] for role in ROLES}
+        for role, person in local_relatives(self.db, self.person):
+            local[role].append(self.local_summary(person))
+        remote = {role: [] for role in ROLES}
+        for role, person in remote_relatives(self.profile):
+            remote[role].append(person)
+
+        self.rows = []
+        for role in ROLES:
+            self.compare_role(role, local[role], remote[role])
+        return self.rows
+
+
+    def compare_role(self, role, local, remote):
+        """
+        Pair up the Gramps and WikiTree relatives in one role.
+        """
+        pairs = []
+
+        # Pair linked people first
+        remote_by_id = {r.get('Name'): r for r in remote}
+        for loc in local:
+            rem = remote_by_id.get(loc['id']) if loc['id'] else None
+            if rem is not None:
+                pairs.append((loc, rem))
+        paired_local = set(id(loc) for loc, rem in pairs)
+        paired_remote = set(id(rem) for loc, rem in pairs)
+
+        # Then the best name and date matches
+        candidates = []
+        for loc in local:
+            if id(loc) in paired_local:
+                continue
+            for rem in remote:
+                if id(rem) in paired_remote:
+                    continue
+                score = self.score(loc, rem)
+                if score >= MIN_MATCH_SCORE:
+                    candidates.append((score, loc, rem))
+        candidates.sort(key=lambda c: -c[0])
+        for score, loc, rem in candidates:
+            if id(loc) in paired_local or id(rem) in paired_remote:
+                continue
+            pairs.append((loc, rem))
+            paired_local.add(id(loc))
+            paired_remote.add(id(rem))
+
+        for loc, rem in pairs:
+            notes = self.differences(loc, rem)
+            self.rows.append((role, loc, rem, CONFLICT if notes else SAME, notes))
+
+        for rem in remote:
+            if id(rem) not in paired_remote:
+                notes = []
+                handle = self.index.get_handle(rem.get('Name'))
+                if handle:
+                    notes.append(_('linked to another Gramps person'))
+                self.rows.append((role, None, rem, MISSING, notes))
+
+        for loc in local:
+            if id(loc) not in paired_local:
+                notes = []
+                if loc['id']:
+                    notes.append(_('linked to %s') % loc['id'])
+                self.rows.append((role, loc, None, EXTRA, notes))
+
+
+    def differences(self, local, remote):
+        """
+        Conflicts between a paired Gramps and WikiTree person.
+        """
+        notes = []
+        if local['id'] and local['id'] != remote.get('Name'):
+            notes.append(_('linked to %s') % local['id'])
+        for key, remote_key, label in (('birth', 'BirthDate', _('birth')),
+                                       ('death', 'DeathDate', _('death'))):
+            local_year = local[key]
+            remote_year = wikitree_year(remote.get(remote_key))
+            if local_year and remote_year and local_year != remote_year:
+                notes.append(_('%(event)s %(gramps)d / %(wikitree)d')
+                             % {'event': label, 'gramps': local_year,
+                                'wikitree': remote_year})
+            elif local_year and not remote_year:
+                notes.append(_('%(event)s %(year)d not on WikiTree')
+                             % {'event': label, 'year': local_year})
+            elif remote_year and not local_year:
+                notes.append(_('%(event)s %(year)d not in Gramps')
+                             % {'event': label, 'year': remote_year})
+        return notes
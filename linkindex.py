@@ -0,0 +1,225 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+# Other gramplet modules
+from services import get_wikitree_attributes
+from snapshot import (load_section, save_section, db_watermark,
+                      iter_change_times)
+
+
+
+SNAPSHOT_SECTION = 'links'
+
+_indexes = {}
+
+
+
+def get_link_index(db):
+    """
+    The link index for a database, loaded or built on first use.
+    """
+    index = peek_link_index(db)
+    if index is None:
+        save_link_indexes()
+        _indexes.clear()
+        index = _indexes[id(db)] = LinkIndex(db)
+    return index
+
+
+def peek_link_index(db):
+    """
+    The link index for a database if it has been loaded, else None.
+    """
+    index = _indexes.get(id(db))
+    if index is None or index.db is not db:
+        return None
+    return index
+
+
+def people_changed(db, person_handles):
+    """
+    People were added, changed or deleted: update the link index, if it
+    is loaded.
+    """
+    index = peek_link_index(db)
+    if index is not None:
+        index.update_handles(person_handles)
+
+
+def save_link_indexes():
+    """
+    Save the loaded link indexes that changed since they were loaded.
+    """
+    for index in _indexes.values():
+        index.save()
+
+
+
+#====================================================
+#
+# Class LinkIndex
+#
+#====================================================
+
+class LinkIndex:
+    """
+    Map between Gramps person handles and WikiTree ids, for the people
+    with a WikiTree attribute, and the WikiTree last-modified time of each
+    profile as of the last sync.
+
+    The index is kept in a snapshot between sessions. If the database has
+    changed since the snapshot was saved, only the people changed since
+    then are read again.
+    """
+
+    def __init__(self, db):
+        """
+        """
+        self.db = db
+        self.handle_to_id = {}
+        self.id_to_handle = {}
+        self.touched = {}       # handle -> WikiTree 'Touched' timestamp
+        self.max_change = 0     # newest person change time seen
+        self.covered = set()    # handles of all the people seen
+        self.dirty = False
+
+        section = load_section(db, SNAPSHOT_SECTION)
+        if section is None:
+            self.refresh()
+        else:
+            for handle, (wikitree_id, touched) in section['data'].items():
+                self.set(handle, wikitree_id, touched)
+            self.max_change = section['max_change']
+            self.covered = set(section['handles'])
+            self.dirty = False
+            if section['watermark'] != db_watermark(self.db):
+                self.refresh(section['max_change'])
+        self.save()
+
+
+    def refresh(self, since=None):
+        """
+        Read the WikiTree attributes of the people changed after since,
+        or of everyone, and drop the people no longer in the database.
+        When since is given, change times are compared on the raw data,
+        and only the changed people, and those not seen before, are read.
+        """
+        seen = set()
+        if since is None:
+            for person in self.db.iter_people():
+                seen.add(person.get_handle())
+                self.max_change = max(self.max_change, person.get_change_time())
+                self.update_person(person)
+        else:
+            for handle, change in iter_change_times(self.db, 'Person'):
+                seen.add(handle)
+                if change < since and handle in self.covered:
+                    continue
+                self.max_change = max(self.max_change, change)
+                self.update_person(self.db.get_person_from_handle(handle))
+        for handle in set(self.handle_to_id) - seen:
+            self.remove(handle)
+        self.covered = seen
+        self.dirty = True
+
+
+    def update_person(self, person):
+        """
+        Update the index from the WikiTree attribute of a person.
+        """
+        handle = person.get_handle()
+        attrs = get_wikitree_attributes(self.db, person)
+        if attrs and attrs.get('id'):
+            if self.handle_to_id.get(handle) != attrs['id'] \
+                    or self.touched.get(handle) != attrs.get('touched'):
+                self.set(handle, attrs['id'])
+                self.touched[handle] = attrs.get('touched')
+        elif handle in self.handle_to_id:
+            self.remove(handle)
+
+
+    def update_handles(self, person_handles):
+        """
+        Update the index for people added, changed or deleted in this
+        session.
+        """
+        for handle in person_handles:
+            if not self.db.has_person_handle(handle):
+                self.covered.discard(handle)
+                if handle in self.handle_to_id:
+                    self.remove(handle)
+                continue
+            self.covered.add(handle)
+            person = self.db.get_person_from_handle(handle)
+            self.max_change = max(self.max_change, person.get_change_time())
+            self.update_person(person)
+
+
+    def set(self, person_handle, wikitree_id, touched=None):
+        """
+        Record (or change) the WikiTree id of a person.
+        """
+        old_id = self.handle_to_id.get(person_handle)
+        if old_id and self.id_to_handle.get(old_id) == person_handle:
+            del self.id_to_handle[old_id]
+        self.handle_to_id[person_handle] = wikitree_id
+        self.id_to_handle[wikitree_id] = person_handle
+        if old_id != wikitree_id or touched:
+            self.touched[person_handle] = touched
+        self.dirty = True
+
+
+    def remove(self, person_handle):
+        """
+        Forget a person.
+        """
+        wikitree_id = self.handle_to_id.pop(person_handle, None)
+        if wikitree_id and self.id_to_handle.get(wikitree_id) == person_handle:
+            del self.id_to_handle[wikitree_id]
+        self.touched.pop(person_handle, None)
+        self.dirty = True
+
+
+    def save(self):
+        """
+        Save the index to the snapshot, if it changed.
+        """
+        if not self.dirty:
+            return
+        data = {handle: [wikitree_id, self.touched.get(handle)]
+                for handle, wikitree_id in self.handle_to_id.items()}
+        save_section(self.db, SNAPSHOT_SECTION, self.max_change, self.covered,
+                     data)
+        self.dirty = False
+
+
+    def get_touched(self, person_handle):
+        return self.touched.get(person_handle)
+
+
+    def get_id(self, person_handle):
+        return self.handle_to_id.get(person_handle)
+
+
+    def get_handle(self, wikitree_id):
+        return self.id_to_handle.get(wikitree_id)
+
+
+    def __len__(self):
+        return len(self.handle_to_id)
@@ -0,0 +1,225 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from bisect import bisect_left
+from collections import Counter
+import os
+import threading
+
+
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+_registry = None
+
+
+
+def get_metrics():
+    """
+    The metrics registry shared by the gramplet.
+    """
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
+
+
+
+#====================================================
+#
+# Class ActionMetrics
+#
+#====================================================
+
+class ActionMetrics:
+    """
+    Metrics for one API action.
+    """
+
+    def __init__(self):
+        """
+        """
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.statuses = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+    def observe(self, seconds, status, bytes_sent, bytes_received):
+        self.bucket_counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.latency_sum += seconds
+        self.requests += 1
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.statuses[str(status)] += 1
+
+
+    def quantile(self, q):
+        """
+        Estimated latency quantile: the upper bound of the bucket it
+        falls in.
+        """
+        if not self.requests:
+            return 0.0
+        rank = q * self.requests
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.bucket_counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return LATENCY_BUCKETS[-1]
+
+
+
+#====================================================
+#
+# Class MetricsRegistry
+#
+#====================================================
+
+class MetricsRegistry:
+    """
+    Latency histograms, bytes transferred, status codes and cache hits
+    and misses, per WikiTree API action.
+    """
+
+    def __init__(self):
+        """
+        """
+        self.lock = threading.Lock()
+        self.actions = {}
+
+
+    def _action(self, action):
+        metrics = self.actions.get(action)
+        if metrics is None:
+            metrics = self.actions[action] = ActionMetrics()
+        return metrics
+
+
+    def observe(self, action, seconds, status, bytes_sent, bytes_received):
+        """
+        Record one request sent to the API. status is the HTTP status,
+        or 'error' if no response was received. bytes_received is the
+        size of the decompressed body.
+        """
+        with self.lock:
+            self._action(action).observe(seconds, status, bytes_sent,
+                                         bytes_received)
+
+
+    def cache_hit(self, action):
+        with self.lock:
+            self._action(action).cache_hits += 1
+
+
+    def cache_miss(self, action):
+        with self.lock:
+            self._action(action).cache_misses += 1
+
+
+    def reset(self):
+        with self.lock:
+            self.actions = {}
+
+
+    def summary_rows(self):
+        """
+        One row per action: (action, requests, mean seconds, p95 seconds,
+        bytes received, cache hit rate, statuses).
+        """
+        rows = []
+        with self.lock:
+            for action, m in sorted(self.actions.items()):
+                lookups = m.cache_hits + m.cache_misses
+                rows.append((action,
+                             m.requests,
+                             m.latency_sum / m.requests if m.requests else 0.0,
+                             m.quantile(0.95),
+                             m.bytes_received,
+                             m.cache_hits / lookups if lookups else 0.0,
+                             dict(m.statuses)))
+        return rows
+
+
+    def to_prometheus(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        def header(name, kind, text):
+            lines.append('# HELP %s %s' % (name, text))
+            lines.append('# TYPE %s %s' % (name, kind))
+
+        with self.lock:
+            actions = sorted(self.actions.items())
+
+            name = 'wikitree_api_request_duration_seconds'
+            header(name, 'histogram', 'Latency of WikiTree API requests.')
+            for action, m in actions:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, m.bucket_counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('%s_bucket{action="%s",le="%s"} %d'
+                                 % (name, action, le, cumulative))
+                lines.append('%s_sum{action="%s"} %r' % (name, action, m.latency_sum))
+                lines.append('%s_count{action="%s"} %d' % (name, action, m.requests))
+
+            name = 'wikitree_api_responses_total'
+            header(name, 'counter', 'WikiTree API requests by status code, '
+                   'or error if there was no response.')
+            for action, m in actions:
+                for status, count in sorted(m.statuses.items()):
+                    lines.append('%s{action="%s",status="%s"} %d'
+                                 % (name, action, status, count))
+
+            for name, attr, text in (
+                    ('wikitree_api_request_bytes_total', 'bytes_sent',
+                     'Bytes sent to the WikiTree API.'),
+                    ('wikitree_api_response_bytes_total', 'bytes_received',
+                     'Decompressed bytes received from the WikiTree API.'),
+                    ('wikitree_api_cache_hits_total', 'cache_hits',
+                     'WikiTree API calls answered from the cache.'),
+                    ('wikitree_api_cache_misses_total', 'cache_misses',
+                     'WikiTree API calls not found in the cache.')):
+                header(name, 'counter', text)
+                for action, m in actions:
+                    lines.append('%s{action="%s"} %d'
+                                 % (name, action, getattr(m, attr)))
+
+        return "\n".join(lines) + "\n"
+
+
+    def write_prometheus(self, path):
+        """
+        Write the metrics to a Prometheus text file, for example for the
+        node exporter textfile collector.
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
@@ -0,0 +1,134 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+# Generations of ancestors examined
+MAX_GENERATIONS = 25
+
+
+
+#====================================================
+#
+# Class PedigreeCollapse
+#
+#====================================================
+
+class PedigreeCollapse:
+    """
+    Ancestor multiplicity and implex (pedigree collapse) for a person.
+
+    Rather than enumerating every path through the pedigree, which grows
+    as 2**n, each generation is kept as a map from ancestor to the number
+    of paths leading to it. The next generation is built from the
+    distinct ancestors of the current one only, so the cost is bounded by
+    the number of distinct ancestors times the number of generations.
+    """
+
+    def __init__(self, db, max_generations=MAX_GENERATIONS):
+        """
+        """
+        self.db = db
+        self.max_generations = max_generations
+        self.parents_cache = {}
+
+        # Results of compute()
+        self.generations = []   # per generation: {handle: number of paths}
+        self.truncated = False
+
+
+    def get_parents(self, person_handle):
+        """
+        Handles of the birth parents of a person. Memoized, so a person
+        reached by several paths is only looked up once.
+        """
+        parents = self.parents_cache.get(person_handle)
+        if parents is None:
+            parents = ()
+            person = self.db.get_person_from_handle(person_handle)
+            family_handle = person.get_main_parents_family_handle()
+            if family_handle:
+                family = self.db.get_family_from_handle(family_handle)
+                parents = tuple(h for h in (family.get_father_handle(),
+                                            family.get_mother_handle()) if h)
+            self.parents_cache[person_handle] = parents
+        return parents
+
+
+    def compute(self, person_handle):
+        """
+        Compute the ancestor generations of a person, up to max_generations.
+        """
+        self.generations = []
+        self.truncated = False
+        layer = {person_handle: 1}
+        for gen in range(self.max_generations):
+            next_layer = {}
+            for handle, paths in layer.items():
+                for parent in self.get_parents(handle):
+                    next_layer[parent] = next_layer.get(parent, 0) + paths
+            if not next_layer:
+                break
+            self.generations.append(next_layer)
+            layer = next_layer
+        else:
+            self.truncated = any(self.get_parents(h) for h in layer)
+        return self
+
+
+    def generation_rows(self):
+        """
+        One row per generation: (generation, possible ancestors, known
+        ancestor slots, distinct ancestors, collapse ratio).
+        """
+        rows = []
+        for gen, layer in enumerate(self.generations, 1):
+            known = sum(layer.values())
+            distinct = len(layer)
+            rows.append((gen, 2**gen, known, distinct,
+                         (known - distinct) / known))
+        return rows
+
+
+    def totals(self):
+        """
+        (known ancestor slots, distinct ancestors, collapse ratio) over
+        all generations. An ancestor in several generations counts once.
+        """
+        known = sum(sum(layer.values()) for layer in self.generations)
+        distinct = len(set().union(*self.generations)) \
+                   if self.generations else 0
+        return (known, distinct, (known - distinct) / known if known else 0.0)
+
+
+    def repeated_ancestors(self):
+        """
+        Ancestors reached by more than one path, as a list of
+        (handle, number of paths, list of generations), most repeated first.
+        """
+        occurrences = {}
+        for gen, layer in enumerate(self.generations, 1):
+            for handle, paths in layer.items():
+                entry = occurrences.setdefault(handle, [0, []])
+                entry[0] += paths
+                entry[1].append(gen)
+        repeated = [(handle, paths, gens)
+                    for handle, (paths, gens) in occurrences.items()
+                    if paths > 1]
+        repeated.sort(key=lambda r: (-r[1], r[2][0]))
+        return repeated
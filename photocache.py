@@ -0,0 +1,272 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import threading
+import time
+
+try:
+    import gi
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GLib, GdkPixbuf
+    _call_in_main_loop = GLib.idle_add
+except (ImportError, ValueError):
+    GdkPixbuf = None
+    _call_in_main_loop = None
+
+
+# Other gramplet modules
+from wikitreeapi import get_api
+
+
+
+WIKITREE_URL = 'https://www.wikitree.com'
+
+# Bytes of photos kept on disk
+DISK_BYTES = 50 * 1024 * 1024
+
+# Thumbnails kept in memory
+THUMBNAIL_ENTRIES = 64
+
+# Downloads and thumbnails made at once
+PHOTO_WORKERS = 2
+
+_photo_cache = None
+
+
+
+def photo_url(profile):
+    """
+    URL of the photo of a WikiTree profile, or None.
+    """
+    data = profile.get('PhotoData') or {}
+    path = data.get('url') or data.get('path')
+    if not path:
+        return None
+    if path.startswith('/'):
+        return WIKITREE_URL + path
+    return path
+
+
+def default_cache_dir():
+    """
+    Directory for the photos.
+    """
+    try:
+        from gramps.gen.const import USER_CACHE as base
+    except ImportError:
+        from gramps.gen.const import USER_HOME as base
+    return os.path.join(base, 'wikitree', 'photos')
+
+
+def get_photo_cache():
+    """
+    The photo cache shared by all windows.
+    """
+    global _photo_cache
+    if _photo_cache is None:
+        _photo_cache = PhotoCache(default_cache_dir())
+    return _photo_cache
+
+
+
+#====================================================
+#
+# Class PhotoCache
+#
+#====================================================
+
+class PhotoCache:
+    """
+    Photos downloaded from WikiTree, kept on disk under a byte budget,
+    and thumbnails of them kept in memory.
+
+    Photo files are named by a hash of their content, so a photo used by
+    several profiles is stored once. A small index maps URLs to content
+    hashes. When the photos take more than the budget, the least
+    recently used are removed; the modification time of each file is
+    its last use.
+
+    Downloads and thumbnails are made in worker threads. Requests for the
+    same thumbnail while it is being made share one job.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DISK_BYTES,
+                 thumbnail_entries=THUMBNAIL_ENTRIES):
+        """
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.thumbnail_entries = thumbnail_entries
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pending = {}               # (url, size) -> list of callbacks
+        self.thumbnails = OrderedDict() # (content hash, size) -> pixbuf
+
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                self.urls = json.load(f)        # url -> content hash
+        except (OSError, ValueError):
+            self.urls = {}
+
+        # Content hash -> size, least recently used first
+        self.files = OrderedDict()
+        entries = [e for e in os.scandir(cache_dir)
+                   if e.is_file() and e.name.endswith('.img')]
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self.files[entry.name[:-4]] = entry.stat().st_size
+        self.total_bytes = sum(self.files.values())
+
+
+    def request(self, url, size, callback):
+        """
+        Call callback(pixbuf) from the main loop with a thumbnail of the
+        photo at url that fits in size x size pixels, or with None if
+        it cannot be had.
+        """
+        key = (url, size)
+        with self.lock:
+            content_hash = self.urls.get(url)
+            pixbuf = self.thumbnails.get((content_hash, size))
+            if pixbuf is not None:
+                self.thumbnails.move_to_end((content_hash, size))
+            elif key in self.pending:
+                self.pending[key].append(callback)
+                return
+            else:
+                self.pending[key] = [callback]
+        if pixbuf is not None:
+            callback(pixbuf)
+            return
+
+        future = self._get_executor().submit(self._thumbnail, url, size)
+        future.add_done_callback(lambda f: self._done(key, f))
+
+
+    def _thumbnail(self, url, size):
+        """
+        Make a thumbnail, downloading the photo if needed. Runs in a
+        worker thread.
+        """
+        path = self.fetch(url)
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(path, size, size)
+        with self.lock:
+            self.thumbnails[(self.urls.get(url), size)] = pixbuf
+            while len(self.thumbnails) > self.thumbnail_entries:
+                self.thumbnails.popitem(last=False)
+        return pixbuf
+
+
+    def _done(self, key, future):
+        try:
+            pixbuf = future.result()
+        except Exception:
+            pixbuf = None
+        with self.lock:
+            callbacks = self.pending.pop(key, [])
+        for callback in callbacks:
+            if _call_in_main_loop:
+                _call_in_main_loop(callback, pixbuf)
+            else:
+                callback(pixbuf)
+
+
+    def fetch(self, url):
+        """
+        Path of the cached photo at url, downloading it if needed.
+        """
+        with self.lock:
+            content_hash = self.urls.get(url)
+            if content_hash in self.files:
+                self.files.move_to_end(content_hash)
+                path = self._path(content_hash)
+                os.utime(path)
+                return path
+
+        api = get_api()
+        start = time.perf_counter()
+        response = api.session.get(url, timeout=30)
+        api.metrics.observe('photo', time.perf_counter() - start,
+                            response.status_code, len(url),
+                            len(response.content))
+        response.raise_for_status()
+        content = response.content
+        content_hash = hashlib.sha1(content).hexdigest()
+        path = self._path(content_hash)
+
+        with self.lock:
+            if content_hash not in self.files:
+                tmp_path = '%s.%d.tmp' % (path, threading.get_ident())
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+                self.files[content_hash] = len(content)
+                self.total_bytes += len(content)
+            self.files.move_to_end(content_hash)
+            self.urls[url] = content_hash
+            self._evict(keep=content_hash)
+            self._save_index()
+        return path
+
+
+    def _evict(self, keep):
+        """
+        Remove the least recently used photos until the cache is within
+        its budget.
+        """
+        while self.total_bytes > self.max_bytes and len(self.files) > 1:
+            content_hash, size = next(iter(self.files.items()))
+            if content_hash == keep:
+                break
+            del self.files[content_hash]
+            self.total_bytes -= size
+            try:
+                os.remove(self._path(content_hash))
+            except OSError:
+                pass
+        live = set(self.files)
+        self.urls = {url: h for url, h in self.urls.items() if h in live}
+
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.urls, f, separators=(',', ':'))
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            pass
+
+
+    def _path(self, content_hash):
+        return os.path.join(self.cache_dir, content_hash + '.img')
+
+
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=PHOTO_WORKERS)
+        return self.executor
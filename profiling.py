@@ -0,0 +1,167 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from collections import Counter
+import json
+import re
+import time
+
+
+
+_COUNTED = re.compile(r'^(get_\w+_from_handle|find_backlink_handles)$')
+
+
+
+#====================================================
+#
+# Class CountingDb
+#
+#====================================================
+
+class CountingDb:
+    """
+    Database proxy that counts calls to the get_*_from_handle methods and
+    to find_backlink_handles. Anything else is passed straight through.
+    """
+
+    def __init__(self, db):
+        """
+        """
+        self.db = db
+        self.counts = Counter()
+
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not _COUNTED.match(name):
+            return attr
+
+        def counted(*args, **kwargs):
+            self.counts[name] += 1
+            return attr(*args, **kwargs)
+
+        # Cache the wrapper, so __getattr__ is only called once per name
+        setattr(self, name, counted)
+        return counted
+
+
+    def reset(self):
+        """
+        Return the counts so far, and start counting from zero.
+        """
+        counts = self.counts
+        self.counts = Counter()
+        return counts
+
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+
+#====================================================
+#
+# Class SectionProfiler
+#
+#====================================================
+
+class SectionProfiler:
+    """
+    Record wall time and database calls per bio section.
+
+    The generator reads the database through self.db, a CountingDb, so
+    calls are counted per section. Only used when profiling is turned
+    on, so there is no cost otherwise.
+    """
+
+    def __init__(self, db):
+        """
+        """
+        self.db = CountingDb(db)
+        self.records = []
+        self.timers = {}        # name -> [seconds, calls]
+
+
+    def run(self, name, func, *args):
+        """
+        Call func(*args) as the section name, and record its cost.
+        """
+        self.db.reset()
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+        self.records.append({'section': name,
+                             'seconds': seconds,
+                             'calls': dict(self.db.reset())})
+        return result
+
+
+    def timed(self, name, func):
+        """
+        Wrap func, so the time spent in it is added up under name. The
+        time is also counted in the sections it is called from.
+        """
+        timers = self.timers
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer = timers.setdefault(name, [0.0, 0])
+                timer[0] += time.perf_counter() - start
+                timer[1] += 1
+        return wrapper
+
+
+    def add(self, name, seconds):
+        """
+        Record a cost measured elsewhere, such as HTML composition.
+        """
+        self.records.append({'section': name, 'seconds': seconds, 'calls': {}})
+
+
+    def as_dict(self):
+        return {'sections': self.records,
+                'timers': {name: {'seconds': seconds, 'calls': calls}
+                           for name, (seconds, calls) in self.timers.items()},
+                'total_seconds': sum(r['seconds'] for r in self.records)}
+
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+
+    def format_table(self):
+        """
+        The profile as plain text lines, one per section and timer.
+        """
+        lines = []
+        for record in self.records:
+            calls = ', '.join('%s %d' % (name[4:-12] if name.startswith('get_')
+                                         else name, n)
+                              for name, n in sorted(record['calls'].items()))
+            lines.append("%-12s %8.1f ms  %s"
+                         % (record['section'], record['seconds'] * 1000, calls))
+        for name, (seconds, calls) in sorted(self.timers.items()):
+            lines.append("%-12s %8.1f ms  (%d calls, within sections)"
+                         % (name, seconds * 1000, calls))
+        return "\n".join(lines)
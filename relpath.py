@@ -0,0 +1,369 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.lib import Person
+from gramps.gen.display.name import displayer as name_displayer
+from gramps.gen.relationship import get_relationship_calculator
+from gramps.gen.const import GRAMPS_LOCALE as glocale
+
+
+# Other gramplet modules
+from linkindex import get_link_index
+from sync import get_profile_store
+
+
+#------------------#
+# Translation      #
+#------------------#
+try:
+    _trans = glocale.get_addon_translator(__file__)
+    _ = _trans.gettext
+except ValueError:
+    _ = glocale.translation.sgettext
+
+
+
+# Most people visited before giving up
+MAX_VISITED = 500000
+
+# Steps between people in a path
+PARENT = 'parent'       # next person is a parent
+CHILD = 'child'         # next person is a child
+SPOUSE = 'spouse'
+SAME = 'same'           # a Gramps person and their WikiTree profile
+
+_reverse = {PARENT: CHILD, CHILD: PARENT, SPOUSE: SPOUSE, SAME: SAME}
+
+_genders = {'Male': Person.MALE, 'Female': Person.FEMALE}
+
+_graph = None
+_graph_key = None
+
+
+
+def get_wiki_graph():
+    """
+    The graph of the profile store, built again only when the store has
+    changed. Relatives added to it stay until then.
+    """
+    global _graph, _graph_key
+    store = get_profile_store()
+    key = (id(store), store.version)
+    if _graph is None or _graph_key != key:
+        _graph = WikiGraph(store)
+        _graph_key = key
+    return _graph
+
+
+
+#====================================================
+#
+# Class WikiGraph
+#
+#====================================================
+
+class WikiGraph:
+    """
+    Family links between the WikiTree profiles the gramplet knows about:
+    those in the profile store, and any added getRelatives responses.
+    People are identified by their numeric WikiTree user id.
+    """
+
+    def __init__(self, store=None):
+        """
+        """
+        store = store if store is not None else get_profile_store()
+        self.names = {}         # user id -> WikiTree id
+        self.people = {}        # user id -> profile
+        self.links = {}         # user id -> set of (step, user id)
+        for profile in store.profiles.values():
+            self.add_person(profile)
+
+
+    def add_person(self, profile):
+        """
+        Add a profile, and links to its parents.
+        """
+        user_id = profile.get('Id')
+        if not user_id:
+            return
+        if profile.get('Name'):
+            self.names[user_id] = profile['Name']
+        self.people.setdefault(user_id, profile)
+        for key in ('Father', 'Mother'):
+            if profile.get(key):
+                self.add_link(user_id, PARENT, profile[key])
+
+
+    def add_relatives(self, profile):
+        """
+        Add the person of a getRelatives response item, with their
+        parents, spouses and children.
+        """
+        self.add_person(profile)
+        user_id = profile['Id']
+        for key, step in (('Parents', PARENT), ('Spouses', SPOUSE),
+                          ('Children', CHILD)):
+            for relative in (profile.get(key) or {}).values():
+                self.add_person(relative)
+                self.add_link(user_id, step, relative['Id'])
+
+
+    def add_link(self, user_id, step, other_id):
+        self.links.setdefault(user_id, set()).add((step, other_id))
+        self.links.setdefault(other_id, set()).add((_reverse[step], user_id))
+
+
+    def neighbours(self, user_id):
+        return self.links.get(user_id, ())
+
+
+    def gender(self, user_id):
+        profile = self.people.get(user_id) or {}
+        return _genders.get(profile.get('Gender'), Person.UNKNOWN)
+
+
+    def display_name(self, user_id):
+        profile = self.people.get(user_id) or {}
+        name = profile.get('LongName') or profile.get('RealName') \
+               or profile.get('FirstName')
+        wikitree_id = self.names.get(user_id)
+        if name and wikitree_id:
+            return '%s (%s)' % (name, wikitree_id)
+        return name or wikitree_id or '#%s' % user_id
+
+
+
+#====================================================
+#
+# Class RelationshipFinder
+#
+#====================================================
+
+class RelationshipFinder:
+    """
+    Find how two people are related, through the Gramps family tree, the
+    WikiTree profiles the gramplet knows about, and the links between
+    the two.
+
+    People are nodes ('g', handle) for Gramps and ('w', user id) for
+    WikiTree. The search is breadth first from both ends at once,
+    always growing the smaller side, so it only visits the people within
+    about half the length of the path from either end.
+    """
+
+    def __init__(self, db, graph=None):
+        """
+        """
+        self.db = db
+        self.graph = graph if graph is not None else get_wiki_graph()
+        self.index = get_link_index(db)
+        self.relcalc = get_relationship_calculator()
+        self.user_ids = None    # WikiTree id -> user id
+        self.visited = 0
+
+
+    def neighbours(self, node):
+        """
+        (step, node) for each person one step from node.
+        """
+        kind, key = node
+        result = []
+        if kind == 'g':
+            db = self.db
+            person = db.get_person_from_handle(key)
+            for family_handle in person.get_parent_family_handle_list():
+                family = db.get_family_from_handle(family_handle)
+                for handle in (family.get_father_handle(),
+                               family.get_mother_handle()):
+                    if handle:
+                        result.append((PARENT, ('g', handle)))
+            for family_handle in person.get_family_handle_list():
+                family = db.get_family_from_handle(family_handle)
+                for handle in (family.get_father_handle(),
+                               family.get_mother_handle()):
+                    if handle and handle != key:
+                        result.append((SPOUSE, ('g', handle)))
+                for child_ref in family.get_child_ref_list():
+                    result.append((CHILD, ('g', child_ref.ref)))
+            wikitree_id = self.index.get_id(key)
+            user_id = self._user_id(wikitree_id) if wikitree_id else None
+            if user_id:
+                result.append((SAME, ('w', user_id)))
+        else:
+            for step, user_id in self.graph.neighbours(key):
+                result.append((step, ('w', user_id)))
+            wikitree_id = self.graph.names.get(key)
+            handle = self.index.get_handle(wikitree_id) if wikitree_id else None
+            if handle:
+                result.append((SAME, ('g', handle)))
+        return result
+
+
+    def _user_id(self, wikitree_id):
+        if self.user_ids is None:
+            self.user_ids = {name: user_id for user_id, name
+                             in self.graph.names.items()}
+        return self.user_ids.get(wikitree_id)
+
+
+    def wikitree_node(self, wikitree_id):
+        """
+        The node for a WikiTree id: the linked Gramps person if there is
+        one, else the WikiTree profile.
+        """
+        handle = self.index.get_handle(wikitree_id)
+        if handle:
+            return ('g', handle)
+        user_id = self._user_id(wikitree_id)
+        return ('w', user_id) if user_id else None
+
+
+    def find(self, start, goal):
+        """
+        The shortest path from start to goal, as a list of
+        (step, node) starting with (None, start), or None.
+        """
+        if start is None or goal is None:
+            return None
+        if start == goal:
+            return [(None, start)]
+        # node -> (step from previous node, previous node)
+        forward = {start: None}
+        backward = {goal: None}
+        forward_frontier = [start]
+        backward_frontier = [goal]
+        self.visited = 0
+
+        while forward_frontier and backward_frontier \
+                and self.visited < MAX_VISITED:
+            grow_forward = len(forward_frontier) <= len(backward_frontier)
+            frontier = forward_frontier if grow_forward else backward_frontier
+            seen = forward if grow_forward else backward
+            other = backward if grow_forward else forward
+
+            next_frontier = []
+            for node in frontier:
+                for step, next_node in self.neighbours(node):
+                    if next_node in seen:
+                        continue
+                    seen[next_node] = (step, node)
+                    self.visited += 1
+                    if next_node in other:
+                        return self._path(forward, backward, next_node)
+                    next_frontier.append(next_node)
+
+            if grow_forward:
+                forward_frontier = next_frontier
+            else:
+                backward_frontier = next_frontier
+        return None
+
+
+    def _path(self, forward, backward, meeting):
+        """
+        Join the two halves of the search at the meeting node.
+        """
+        path = []
+        node = meeting
+        while forward[node] is not None:
+            step, previous = forward[node]
+            path.append((step, node))
+            node = previous
+        path.append((None, node))
+        path.reverse()
+
+        node = meeting
+        while backward[node] is not None:
+            step, next_node = backward[node]
+            path.append((_reverse[step], next_node))
+            node = next_node
+        return path
+
+
+    def gender(self, node):
+        kind, key = node
+        if kind == 'g':
+            return self.db.get_person_from_handle(key).get_gender()
+        return self.graph.gender(key)
+
+
+    def display_name(self, node):
+        kind, key = node
+        if kind == 'g':
+            person = self.db.get_person_from_handle(key)
+            return name_displayer.display_name(person.get_primary_name())
+        return self.graph.display_name(key)
+
+
+    def describe(self, path):
+        """
+        Describe a path as a list of sentences "B is the <relationship> of
+        A", one per blood relationship or marriage along the way.
+        """
+        # Drop the steps between a Gramps person and their own profile
+        steps = [(step, node) for (step, node) in path if step != SAME]
+
+        sentences = []
+        i = 0
+        while i < len(steps) - 1:
+            a = steps[i][1]
+            if steps[i+1][0] == SPOUSE:
+                b = steps[i+1][1]
+                relation = self.relcalc.get_partner_relationship_string(
+                        self.relcalc.PARTNER_MARRIED, self.gender(a), self.gender(b))
+                i += 1
+            else:
+                # Up to the common ancestor, then down
+                up = []
+                j = i + 1
+                while j < len(steps) and steps[j][0] == PARENT:
+                    up.append(steps[j][1])
+                    j += 1
+                down = []
+                while j < len(steps) and steps[j][0] == CHILD:
+                    down.append(steps[j][1])
+                    j += 1
+                b = steps[j-1][1]
+                # Codes for each step up to the common ancestor, from a
+                # and from b
+                common = ([a] + up)[-1]
+                to_common_a = ''.join(self._code(n) for n in up)
+                from_b = list(reversed([common] + down))[1:]
+                to_common_b = ''.join(self._code(n) for n in from_b)
+                relation = self.relcalc.get_single_relationship_string(
+                        len(up), len(down), self.gender(a), self.gender(b),
+                        to_common_a, to_common_b)
+                i = j - 1
+            sentences.append(_('%(person)s is the %(relationship)s of '
+                               '%(other)s')
+                             % {'person': self.display_name(b),
+                                'relationship': relation,
+                                'other': self.display_name(a)})
+        return sentences
+
+
+    def _code(self, node):
+        """
+        Relationship calculator code for a step up to node.
+        """
+        return self.relcalc.REL_FATHER if self.gender(node) == Person.MALE \
+               else self.relcalc.REL_MOTHER
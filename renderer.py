@@ -0,0 +1,293 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import mwparserfromhell
+    import mwcomposerfromhell
+    have_html = True
+except ImportError:
+    have_html = False
+
+try:
+    from gi.repository import GLib
+    _call_in_main_loop = GLib.idle_add
+except ImportError:
+    _call_in_main_loop = None
+
+
+
+MEMORY_CACHE_ENTRIES = 64
+
+# Script run as the render worker process
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'renderworker.py')
+
+_default_renderer = None
+
+
+
+def render_html(wikitext):
+    """
+    Convert wikitext to HTML. Runs in the render worker process.
+    """
+    wikicode = mwparserfromhell.parse(wikitext)
+    return mwcomposerfromhell.compose(wikicode)
+
+
+def wikitext_key(wikitext):
+    """
+    Cache key for a piece of wikitext.
+    """
+    return hashlib.sha1(wikitext.encode('utf-8')).hexdigest()
+
+
+def default_cache_dir():
+    """
+    Directory for the disk tier of the shared renderer.
+    """
+    try:
+        from gramps.gen.const import USER_CACHE as base
+    except ImportError:
+        from gramps.gen.const import USER_HOME as base
+    return os.path.join(base, 'wikitree', 'html')
+
+
+def get_renderer():
+    """
+    The renderer shared by all windows.
+    """
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = HtmlRenderer(disk_dir=default_cache_dir())
+    return _default_renderer
+
+
+
+#====================================================
+#
+# Class HtmlRenderer
+#
+#====================================================
+
+class HtmlRenderer:
+    """
+    Render wikitext to HTML, with a bounded in-memory cache and an
+    optional on-disk cache, both keyed by a hash of the wikitext. Cache
+    misses are rendered in a separate worker process, so the Gtk main
+    loop is never blocked by the parser.
+    """
+
+    def __init__(self, memory_entries=MEMORY_CACHE_ENTRIES, disk_dir=None):
+        """
+        """
+        self.memory_entries = memory_entries
+        self.disk_dir = disk_dir
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = None
+        self.process = None
+        self.pending = {}       # key -> list of callbacks
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+
+    def lookup(self, wikitext):
+        """
+        Return the cached HTML for the wikitext, or None.
+        """
+        key = wikitext_key(wikitext)
+        html = self._memory_get(key)
+        if html is None:
+            html = self._disk_get(key)
+            if html is not None:
+                self._memory_put(key, html)
+        return html
+
+
+    def render(self, wikitext, callback):
+        """
+        Call callback(html) with the rendered wikitext: at once if it is
+        cached, else from the main loop when the worker is done. Requests
+        for the same text while it is being rendered share one job.
+        """
+        html = self.lookup(wikitext)
+        if html is not None:
+            callback(html)
+            return
+
+        key = wikitext_key(wikitext)
+        with self.lock:
+            if key in self.pending:
+                self.pending[key].append(callback)
+                return
+            self.pending[key] = [callback]
+
+        future = self._get_executor().submit(self._render_in_worker, wikitext)
+        future.add_done_callback(lambda f: self._rendered(key, f))
+
+
+    def render_timed(self, wikitext, callback):
+        """
+        Like render(), but call callback(html, seconds), where seconds is
+        the time taken to render, or None if the HTML was cached.
+        """
+        if self.lookup(wikitext) is not None:
+            self.render(wikitext, lambda html: callback(html, None))
+            return
+        start = time.perf_counter()
+        self.render(wikitext,
+                    lambda html: callback(html, time.perf_counter() - start))
+
+
+    def render_to_webview(self, webview, wikitext):
+        """
+        Render the wikitext and load it into a WebKit2.WebView. Only the
+        most recent request for a given view is shown.
+        """
+        key = wikitext_key(wikitext)
+        webview.wikitree_render_key = key
+
+        def show(html):
+            if getattr(webview, 'wikitree_render_key', None) == key:
+                webview.load_html(html, None)
+        self.render(wikitext, show)
+
+
+    def _rendered(self, key, future):
+        """
+        Worker done: cache the result, and hand it to the callbacks.
+        Runs in an executor thread.
+        """
+        try:
+            html = future.result()
+        except Exception as err:
+            html = '<pre>%s</pre>' % escape(str(err))
+        else:
+            self._memory_put(key, html)
+            self._disk_put(key, html)
+
+        with self.lock:
+            callbacks = self.pending.pop(key, [])
+        for callback in callbacks:
+            if _call_in_main_loop:
+                _call_in_main_loop(callback, html)
+            else:
+                callback(html)
+
+
+    def _get_executor(self):
+        # One thread feeds the worker process, one request at a time
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        return self.executor
+
+
+    def _render_in_worker(self, wikitext):
+        """
+        Render wikitext in the worker process, starting it if needed.
+        Runs in the executor thread.
+
+        The worker is a script of its own, rather than a multiprocessing
+        child: neither forking a process running Gtk nor spawning one,
+        which imports the unguarded Gramps launcher again, is safe.
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.process = subprocess.Popen([sys.executable, WORKER_SCRIPT],
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            encoding='utf-8')
+        try:
+            self.process.stdin.write(json.dumps(wikitext) + "\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        except OSError:
+            line = ''
+        if not line:
+            self.process = None
+            raise RuntimeError("The render worker process stopped")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['html']
+
+
+    def _memory_get(self, key):
+        with self.lock:
+            html = self.memory.get(key)
+            if html is not None:
+                self.memory.move_to_end(key)
+            return html
+
+
+    def _memory_put(self, key, html):
+        with self.lock:
+            self.memory[key] = html
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + '.html')
+
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+    def _disk_put(self, key, html):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(html)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process = None
@@ -0,0 +1,47 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Render worker process for renderer.HtmlRenderer.
+
+Reads one JSON-encoded wikitext string per line from stdin, and writes
+one JSON object per line to stdout: {"html": ...} or {"error": ...}.
+Exits when stdin is closed.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import json
+import sys
+
+
+
+def main():
+    from renderer import render_html
+    for line in sys.stdin:
+        try:
+            reply = {'html': render_html(json.loads(line))}
+        except Exception as err:
+            reply = {'error': '%s: %s' % (type(err).__name__, err)}
+        sys.stdout.write(json.dumps(reply) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
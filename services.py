@@ -101,23 +101,63 @@ def save_wikitree_id_to_person(db, person, id):
     """
     Save WikiTree id to specified person
     """
-    attrs = person.get_attribute_list()
-
     with DbTxn("WikiTree Marker", db) as transaction:
-        wtattr = None
-        for attr in attrs:
-            if attr.type.value == 'WikiTree':
-                wtattr = json.loads(attr.get_value())
-                wtattr['id'] = id
-                attr.set_value(json.dumps(wtattr))
-                break
-
-        if not wtattr:
-            wtattr = {'id': id, 'owner': 0}
-            jsattr = json.dumps(wtattr)
-            attr = Attribute()
-            attr.set_type((AttributeType.CUSTOM, 'WikiTree'))
-            attr.set_value(jsattr)
-            person.add_attribute(attr)
-
+        _update_wikitree_attributes(person, {'id': id})
         db.commit_person(person, transaction)
+
+
+def save_wikitree_ids(db, links):
+    """
+    Save WikiTree ids to many people in one transaction. links is a list
+    of (person handle, WikiTree id).
+    """
+    _save_wikitree_attributes(db, "WikiTree Markers",
+                              [(handle, {'id': id}) for handle, id in links])
+
+
+def save_wikitree_touched(db, stamps):
+    """
+    Save the last-modified time of the WikiTree profiles of many people
+    in one transaction. stamps is a list of (person handle, WikiTree
+    'Touched' timestamp). The people keep their change times, so the
+    sync does not mark them as edited.
+    """
+    _save_wikitree_attributes(db, "WikiTree Sync",
+                              [(handle, {'touched': touched})
+                               for handle, touched in stamps],
+                              keep_change_time=True)
+
+
+def _save_wikitree_attributes(db, description, updates,
+                              keep_change_time=False):
+    with DbTxn(description, db) as transaction:
+        for person_handle, values in updates:
+            person = db.get_person_from_handle(person_handle)
+            _update_wikitree_attributes(person, values)
+            change_time = person.get_change_time() if keep_change_time \
+                          else None
+            db.commit_person(person, transaction, change_time)
+
+
+def _update_wikitree_attributes(person, values):
+    """
+    Update the WikiTree attribute of a person with the given values,
+    adding the attribute if needed.
+    """
+    for attr in person.get_attribute_list():
+        if attr.get_type() == 'WikiTree':
+            wtattr = json.loads(attr.get_value())
+            if wtattr.get('id') != values.get('id', wtattr.get('id')):
+                # The sync time of the old profile no longer applies
+                wtattr.pop('touched', None)
+            wtattr.update(values)
+            attr.set_value(json.dumps(wtattr))
+            return
+
+    wtattr = {'id': '', 'owner': 0}
+    wtattr.update(values)
+    jsattr = json.dumps(wtattr)
+    attr = Attribute()
+    attr.set_type((AttributeType.CUSTOM, 'WikiTree'))
+    attr.set_value(jsattr)
+    person.add_attribute(attr)
@@ -0,0 +1,404 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Export generated biographies as a static HTML site.
+
+Reads the bios written by batchexport.py, either a directory of .txt
+files or a JSONL stream, and writes one HTML page per bio and an index.
+Links to other people, [[WikiTreeId|Name]], point to their page in the
+site, or to their WikiTree profile if they have none.
+
+Pages are rendered in a process pool, and each worker writes its own
+pages, so only the wikitext of the bios in flight is held in memory.
+A manifest of page hashes is kept in the output directory, and pages
+whose wikitext and local links have not changed are not rewritten.
+Pages that fail to render, and those of people without a bio in the
+JSONL stream, keep the page from the last export. If several bios have
+the same page name, only the first is exported.
+
+Usage:
+    python siteexport.py (--bios DIR | --jsonl FILE) --output DIR
+                         [--workers N] [--title TEXT]
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from html import escape
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import traceback
+
+
+# Other gramplet modules
+from batchexport import output_name, safe_name
+from dependencies import text_hash
+from renderer import render_html, have_html
+
+
+
+WIKITREE_URL = 'https://www.wikitree.com/wiki/'
+
+MANIFEST_NAME = '.site-manifest.json'
+
+# Pages in flight per worker
+QUEUE_PER_WORKER = 4
+
+# [[WikiTreeId|Name]], as written by format_clickable_name
+_LINK = re.compile(r'\[\[([^\[\]|:/#]+-\d+)\|([^\[\]]+)\]\]')
+_PLACEHOLDER = re.compile(r'WTLINK(\d+)X')
+_TITLE = re.compile(r'<b>(.*?)</b>')
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+</head>
+<body>
+<p><a href="index.html">%(site_title)s</a></p>
+%(body)s
+</body>
+</html>
+"""
+
+# Names of the pages in the site, in each worker process
+_worker_names = None
+_worker_site_title = None
+
+
+
+def read_bios(bios_dir=None, jsonl_file=None):
+    """
+    Yield (page name, wikitext) for each bio, one at a time. The
+    wikitext is None for people in the JSONL stream without a bio, who
+    were skipped or failed; their existing pages are kept.
+    """
+    if bios_dir:
+        for entry in sorted(os.scandir(bios_dir), key=lambda e: e.name):
+            if entry.is_file() and entry.name.endswith('.txt'):
+                with open(entry.path, encoding='utf-8') as f:
+                    yield entry.name[:-4], f.read()
+    else:
+        with open(jsonl_file, encoding='utf-8') as f:
+            for line in f:
+                result = json.loads(line)
+                yield output_name(result)[:-4], result.get('bio')
+
+
+def read_names(bios_dir=None, jsonl_file=None, existing=()):
+    """
+    The names of all the pages, without keeping the bios: the people
+    with a bio, and those without one whose page exists.
+    """
+    if bios_dir:
+        return {entry.name[:-4] for entry in os.scandir(bios_dir)
+                if entry.is_file() and entry.name.endswith('.txt')}
+    return {name for name, bio in read_bios(jsonl_file=jsonl_file)
+            if bio is not None or name in existing}
+
+
+def local_links(wikitext, names):
+    """
+    The sorted page names of the people linked from a bio that have a
+    page.
+    """
+    return sorted({safe_name(m.group(1)) for m in _LINK.finditer(wikitext)
+                   if safe_name(m.group(1)) in names})
+
+
+def link_target(wikitree_id, names):
+    name = safe_name(wikitree_id)
+    if name in names:
+        return name + '.html'
+    return WIKITREE_URL + wikitree_id
+
+
+def page_html(wikitext, names, site_title):
+    """
+    Render a bio to a complete HTML page. Returns (title, html).
+    """
+    # Links are replaced by placeholders before rendering, and by HTML
+    # links after, so the parser cannot turn them into wiki links
+    links = []
+
+    def placeholder(match):
+        links.append(match.groups())
+        return 'WTLINK%dX' % (len(links) - 1)
+
+    body = render_html(_LINK.sub(placeholder, wikitext))
+
+    def link(match):
+        wikitree_id, name = links[int(match.group(1))]
+        return '<a href="%s">%s</a>' % (escape(link_target(wikitree_id, names)),
+                                        escape(name))
+
+    body = _PLACEHOLDER.sub(link, body)
+    match = _TITLE.search(wikitext)
+    title = match.group(1).strip() if match else ''
+    return title, PAGE_TEMPLATE % {'title': escape(title),
+                                   'site_title': escape(site_title),
+                                   'body': body}
+
+
+def write_file(path, text):
+    """
+    Write a file, atomically replacing the old one.
+    """
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _init_worker(names, site_title):
+    global _worker_names, _worker_site_title
+    _worker_names = names
+    _worker_site_title = site_title
+
+
+def _render_one(name, wikitext, path):
+    """
+    Render and write one page in a worker process. Errors are returned,
+    not raised, so one bad bio does not stop the export.
+    """
+    try:
+        title, html = page_html(wikitext, _worker_names, _worker_site_title)
+        write_file(path, html)
+        return name, title, None
+    except Exception:
+        return name, None, traceback.format_exc()
+
+
+
+#====================================================
+#
+# Class SiteExport
+#
+#====================================================
+
+class SiteExport:
+    """
+    Render a set of bios to a static HTML site in output_dir.
+    """
+
+    def __init__(self, output_dir, bios_dir=None, jsonl_file=None,
+                 workers=None, site_title='Biographies', progress=None):
+        """
+        progress, if given, is called as progress(done, name, status)
+        after each page.
+        """
+        if bool(bios_dir) == bool(jsonl_file):
+            raise ValueError("Specify exactly one of bios_dir or jsonl_file")
+
+        self.output_dir = output_dir
+        self.bios_dir = bios_dir
+        self.jsonl_file = jsonl_file
+        self.workers = workers or os.cpu_count() or 1
+        self.site_title = site_title
+        self.progress = progress
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+
+        self.errors = []
+        self.duplicates = []    # names of the bios skipped as duplicates
+        self.written = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.elapsed = 0.0
+
+
+    def load_manifest(self):
+        """
+        name -> [hash, title] of the pages written by the last export.
+        """
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+    def run(self):
+        """
+        Run the export, and return the summary.
+        """
+        start = time.perf_counter()
+        os.makedirs(self.output_dir, exist_ok=True)
+        old_manifest = self.load_manifest()
+        names = read_names(self.bios_dir, self.jsonl_file, old_manifest)
+        manifest = {}
+        hashes = {}             # name -> hash, for the pages in flight
+        seen = set()
+        done = 0
+
+        def finished(future):
+            nonlocal done
+            name, title, error = future.result()
+            key = hashes.pop(name)
+            done += 1
+            if error:
+                # Keep the page from the last export, if there is one
+                self.errors.append((name, error))
+                if name in old_manifest:
+                    manifest[name] = old_manifest[name]
+            else:
+                manifest[name] = [key, title]
+                self.written += 1
+            if self.progress:
+                self.progress(done, name, 'ERROR' if error else 'written')
+
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 initializer=_init_worker,
+                                 initargs=(names, self.site_title)) \
+                as executor:
+            pending = set()
+            for name, wikitext in read_bios(self.bios_dir, self.jsonl_file):
+                if name in seen:
+                    self.duplicates.append(name)
+                    done += 1
+                    if self.progress:
+                        self.progress(done, name, 'duplicate')
+                    continue
+                seen.add(name)
+                if wikitext is None:
+                    if name in old_manifest:
+                        manifest[name] = old_manifest[name]
+                        self.unchanged += 1
+                    done += 1
+                    if self.progress:
+                        self.progress(done, name, 'kept')
+                    continue
+                key = text_hash(wikitext + "\n"
+                                + ' '.join(local_links(wikitext, names)))
+                path = os.path.join(self.output_dir, name + '.html')
+                old = old_manifest.get(name)
+                if old and old[0] == key and os.path.exists(path):
+                    manifest[name] = old
+                    self.unchanged += 1
+                    done += 1
+                    if self.progress:
+                        self.progress(done, name, 'unchanged')
+                    continue
+
+                # Keep only a few pages per worker in flight
+                while len(pending) >= self.workers * QUEUE_PER_WORKER:
+                    completed, pending = wait(pending,
+                                              return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        finished(future)
+                hashes[name] = key
+                pending.add(executor.submit(_render_one, name, wikitext, path))
+            for future in wait(pending).done:
+                finished(future)
+
+        # Pages of people no longer exported
+        for name in set(old_manifest) - set(manifest):
+            try:
+                os.remove(os.path.join(self.output_dir, name + '.html'))
+            except OSError:
+                pass
+            self.removed += 1
+
+        self.write_index(manifest)
+        write_file(self.manifest_path,
+                   json.dumps(manifest, separators=(',', ':')))
+        self.elapsed = time.perf_counter() - start
+        return self.summary()
+
+
+    def write_index(self, manifest):
+        """
+        Write index.html, listing every page by title.
+        """
+        rows = sorted(((title or name, name)
+                       for name, (key, title) in manifest.items()),
+                      key=lambda row: (row[0].lower(), row[1]))
+        path = os.path.join(self.output_dir, 'index.html')
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+                    '<title>%s</title>\n</head>\n<body>\n<h1>%s</h1>\n<ul>\n'
+                    % (escape(self.site_title), escape(self.site_title)))
+            for title, name in rows:
+                f.write('<li><a href="%s.html">%s</a> (%s)</li>\n'
+                        % (escape(name), escape(title), escape(name)))
+            f.write('</ul>\n</body>\n</html>\n')
+        os.replace(tmp_path, path)
+
+
+    def summary(self):
+        """
+        Counts and throughput of the last run.
+        """
+        total = self.written + self.unchanged + len(self.errors)
+        return {'pages': total,
+                'written': self.written,
+                'unchanged': self.unchanged,
+                'removed': self.removed,
+                'duplicates': len(self.duplicates),
+                'errors': len(self.errors),
+                'workers': self.workers,
+                'seconds': round(self.elapsed, 3),
+                'pages_per_second': round(total / self.elapsed, 2) \
+                                    if self.elapsed else 0.0}
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Export generated bios as a static HTML site.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--bios', help="directory of bios written by "
+                       "batchexport.py --output")
+    group.add_argument('--jsonl', help="bios written by batchexport.py --jsonl")
+    parser.add_argument('--output', required=True, help="site directory")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--title', default='Biographies',
+                        help="title of the index page")
+    args = parser.parse_args(argv)
+
+    if not have_html:
+        sys.stderr.write("mwparserfromhell and mwcomposerfromhell are needed "
+                         "to render HTML\n")
+        return 1
+
+    def progress(done, name, status):
+        sys.stderr.write("\r%d %s %s" % (done, name, status))
+
+    export = SiteExport(args.output, bios_dir=args.bios, jsonl_file=args.jsonl,
+                        workers=args.workers, site_title=args.title,
+                        progress=progress)
+    summary = export.run()
+    sys.stderr.write("\n")
+    for name, error in export.errors:
+        sys.stderr.write("%s: %s\n" % (name, error))
+    for name in export.duplicates:
+        sys.stderr.write("%s: more than one bio, only the first exported\n"
+                         % name)
+    print(json.dumps(summary))
+    return 1 if export.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Snapshots of the gramplet's indexes over a database, kept between Gramps
+sessions.
+
+Each database has one snapshot file, holding one section per index.
+A section records the database watermark when it was saved (the newest
+modification time of the database files), the handles of the objects it
+covers and the newest change time among them. If the watermark still
+matches, the section is used as it is. Otherwise only the objects changed
+since then, and those it does not cover, need to be read again; objects
+added by an import can have change times older than the snapshot.
+"""
+
+#-------------------#
+# Python modules    #
+#-------------------#
+import json
+import os
+
+
+
+SNAPSHOT_VERSION = 2
+
+# Position of the change time in the serialized (tuple) form of each kind
+# of object, for databases that do not store objects as JSON
+_CHANGE_INDEX = {'Person': 17, 'Note': 5}
+
+
+
+def snapshot_dir():
+    """
+    Directory for the snapshot files.
+    """
+    try:
+        from gramps.gen.const import USER_CACHE as base
+    except ImportError:
+        from gramps.gen.const import USER_HOME as base
+    return os.path.join(base, 'wikitree', 'snapshots')
+
+
+def snapshot_path(db):
+    """
+    Snapshot file for a database, or None if the database has no id.
+    """
+    dbid = db.get_dbid()
+    if not dbid:
+        return None
+    return os.path.join(snapshot_dir(), 'index-%s.json' % dbid)
+
+
+def db_watermark(db):
+    """
+    Newest modification time of the files of a database, in nanoseconds;
+    0 if unknown.
+    """
+    path = db.get_save_path()
+    if not path or not os.path.isdir(path):
+        return 0
+    newest = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            newest = max(newest, entry.stat().st_mtime_ns)
+    return newest
+
+
+def iter_change_times(db, class_name):
+    """
+    (handle, change time) of every object of a class, such as 'Person',
+    read from the raw data rather than by building each object.
+    """
+    iter_raw = getattr(db, '_iter_raw_%s_data' % class_name.lower(), None)
+    if iter_raw is None:
+        method = getattr(db, 'iter_%ss' % class_name.lower())
+        for obj in method():
+            yield obj.get_handle(), obj.get_change_time()
+        return
+    index = _CHANGE_INDEX[class_name]
+    for handle, data in iter_raw():
+        if isinstance(handle, bytes):
+            handle = handle.decode('utf-8')
+        if isinstance(data, dict):
+            yield handle, data['change']
+        else:
+            yield handle, data[index]
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def load_section(db, name):
+    """
+    A section of the snapshot of a database, as a dict with 'watermark',
+    'max_change', 'handles' and 'data', or None.
+    """
+    path = snapshot_path(db)
+    snapshot = _read(path) if path else None
+    if snapshot is None or snapshot.get('dbid') != db.get_dbid():
+        return None
+    return snapshot['sections'].get(name)
+
+
+def save_section(db, name, max_change, handles, data):
+    """
+    Save a section of the snapshot of a database, atomically replacing
+    the file. handles are those of all the objects the section covers.
+    """
+    path = snapshot_path(db)
+    if path is None:
+        return
+    snapshot = _read(path)
+    if snapshot is None or snapshot.get('dbid') != db.get_dbid():
+        snapshot = {'version': SNAPSHOT_VERSION, 'dbid': db.get_dbid(),
+                    'sections': {}}
+    snapshot['sections'][name] = {'watermark': db_watermark(db),
+                                  'max_change': max_change,
+                                  'handles': sorted(handles),
+                                  'data': data}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
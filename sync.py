@@ -0,0 +1,273 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+
+
+# Other gramplet modules
+from wikitreeapi import get_api
+from linkindex import get_link_index
+from services import save_wikitree_touched
+
+
+
+# Profiles per getPeople request
+SYNC_BATCH = 100
+
+# Requests in flight at once
+DEFAULT_WORKERS = 4
+
+# Fields requested to find out which profiles changed
+MINIMAL_FIELDS = 'Id,Name,Touched'
+
+# Fields kept in the profile store
+PROFILE_FIELDS = ('Id,Name,FirstName,RealName,MiddleName,LastNameAtBirth,'
+                  'LastNameCurrent,Gender,BirthDate,DeathDate,BirthLocation,'
+                  'DeathLocation,Father,Mother,Touched')
+
+_profile_store = None
+
+
+
+def default_profile_store_path():
+    """
+    File for the profile store shared by the gramplet.
+    """
+    try:
+        from gramps.gen.const import USER_CACHE as base
+    except ImportError:
+        from gramps.gen.const import USER_HOME as base
+    return os.path.join(base, 'wikitree', 'profiles.json')
+
+
+def get_profile_store():
+    """
+    The profile store shared by the gramplet.
+    """
+    global _profile_store
+    if _profile_store is None:
+        _profile_store = ProfileStore(default_profile_store_path())
+    return _profile_store
+
+
+
+#====================================================
+#
+# Class ProfileStore
+#
+#====================================================
+
+class ProfileStore:
+    """
+    JSON file holding the last fetched copy of each linked WikiTree
+    profile, keyed by WikiTree id. version is incremented by every
+    change, so users can tell when what they built from it is stale.
+    """
+
+    def __init__(self, path):
+        """
+        """
+        self.path = path
+        self.version = 0
+        self.profiles = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.profiles = json.load(f)
+
+
+    def get(self, wikitree_id):
+        return self.profiles.get(wikitree_id)
+
+
+    def put(self, wikitree_id, profile):
+        self.profiles[wikitree_id] = profile
+        self.version += 1
+
+
+    def __len__(self):
+        return len(self.profiles)
+
+
+    def save(self):
+        """
+        Write the store, atomically replacing the old file.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.profiles, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+
+#====================================================
+#
+# Class LinkSync
+#
+#====================================================
+
+class LinkSync:
+    """
+    Find the linked WikiTree profiles that changed since the last sync.
+
+    A first pass fetches only the id and last-modified time ('Touched')
+    of every linked profile, many profiles per request. Only the profiles
+    whose time differs from the one stored in the person's WikiTree
+    attribute are then fetched in full, into the profile store.
+
+    collect() and mark_synced() use the database, and must run in the
+    main thread; fetch() uses only the API, and can run in a background
+    thread.
+    """
+
+    def __init__(self, api=None, store=None, workers=DEFAULT_WORKERS):
+        """
+        """
+        self.api = api or get_api()
+        self.store = store if store is not None else get_profile_store()
+        self.workers = workers
+
+        self.links = []         # (handle, WikiTree id, stored touched)
+        self.changed = []       # (handle, WikiTree id, old, new touched)
+        self.first_seen = []    # (handle, WikiTree id, touched)
+        self.not_found = []     # (handle, WikiTree id)
+        self.stored = set()     # WikiTree ids fetched into the store
+        self.unfetched = []     # changed WikiTree ids that were not
+        self.requests = 0
+        self.errors = []        # (list of WikiTree ids, error message)
+
+
+    def collect(self, db):
+        """
+        Find the linked people, and when their profiles were last synced.
+        """
+        index = get_link_index(db)
+        self.links = [(handle, wikitree_id, index.get_touched(handle))
+                      for handle, wikitree_id in index.handle_to_id.items()]
+        return self
+
+
+    def fetch(self, progress=None):
+        """
+        Find the changed profiles, and fetch them in full. progress, if
+        given, is called as progress(profiles checked, total).
+        """
+        ids = [wikitree_id for handle, wikitree_id, touched in self.links]
+        batches = [ids[i:i+SYNC_BATCH] for i in range(0, len(ids), SYNC_BATCH)]
+
+        # Pass 1: last-modified times only
+        touched = {}
+        checked = 0
+        for result in self.map_batches(batches, MINIMAL_FIELDS):
+            for wikitree_id, person in result.items():
+                touched[wikitree_id] = person.get('Touched')
+            checked += SYNC_BATCH
+            if progress:
+                progress(min(checked, len(ids)), len(ids))
+
+        # Profiles in failed requests are left for the next sync
+        failed = set(wikitree_id for batch, err in self.errors
+                     for wikitree_id in batch)
+
+        self.changed = []
+        self.first_seen = []
+        self.not_found = []
+        for handle, wikitree_id, old in self.links:
+            if wikitree_id in failed:
+                continue
+            if wikitree_id not in touched:
+                self.not_found.append((handle, wikitree_id))
+            elif old is None:
+                self.first_seen.append((handle, wikitree_id, touched[wikitree_id]))
+            elif touched[wikitree_id] != old:
+                self.changed.append((handle, wikitree_id, old, touched[wikitree_id]))
+
+        # Pass 2: full profiles, for those that changed
+        ids = [link[1] for link in self.changed + self.first_seen]
+        batches = [ids[i:i+SYNC_BATCH] for i in range(0, len(ids), SYNC_BATCH)]
+        self.stored = set()
+        for result in self.map_batches(batches, PROFILE_FIELDS):
+            for wikitree_id, person in result.items():
+                self.store.put(wikitree_id, person)
+                self.stored.add(wikitree_id)
+        self.unfetched = [wikitree_id for wikitree_id in ids
+                          if wikitree_id not in self.stored]
+        if ids:
+            self.store.save()
+        return self
+
+
+    def map_batches(self, batches, fields):
+        """
+        Fetch batches of profiles, a few requests at a time. Yields a dict
+        of WikiTree id -> profile per batch.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [(batch, executor.submit(self.fetch_batch, batch, fields))
+                       for batch in batches]
+            for batch, future in futures:
+                self.requests += 1
+                try:
+                    yield future.result()
+                except Exception as err:
+                    self.errors.append((batch, str(err)))
+
+
+    def fetch_batch(self, ids, fields):
+        """
+        Fetch some profiles with getPeople, and return them by the id
+        they were asked for.
+        """
+        response = self.api.call('getPeople', use_cache=False,
+                                 keys=','.join(ids), fields=fields)
+        result = response[0]
+        people = result.get('people') or {}
+        by_id = {}
+        for key, status in (result.get('resultByKey') or {}).items():
+            person = people.get(str(status.get('Id')))
+            if person is not None:
+                by_id[key] = person
+        return by_id
+
+
+    def mark_synced(self, db):
+        """
+        Store the new last-modified times in the WikiTree attributes, so
+        the next sync only reports later changes. Only the profiles now
+        in the store are marked; the others stay pending.
+        """
+        stamps = [(handle, new) for handle, wikitree_id, old, new in self.changed
+                  if wikitree_id in self.stored] \
+                 + [(handle, new) for handle, wikitree_id, new in self.first_seen
+                    if wikitree_id in self.stored]
+        if not stamps:
+            return
+        save_wikitree_touched(db, stamps)
+        index = get_link_index(db)
+        for handle, touched in stamps:
+            index.set(handle, index.get_id(handle), touched)
+        self.changed = [link for link in self.changed
+                        if link[1] not in self.stored]
+        self.first_seen = [link for link in self.first_seen
+                           if link[1] not in self.stored]
+        self.stored = set()
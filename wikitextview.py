@@ -0,0 +1,219 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from bisect import bisect_right
+import re
+
+#-------------------#
+# Gramps modules    #
+#-------------------#
+from gramps.gen.const import GRAMPS_LOCALE as glocale
+
+#------------------#
+# Gtk modules      #
+#------------------#
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+
+
+#------------------#
+# Translation      #
+#------------------#
+try:
+    _trans = glocale.get_addon_translator(__file__)
+    _ = _trans.gettext
+except ValueError:
+    _ = glocale.translation.sgettext
+
+
+
+#====================================================
+#
+# Class LineIndex
+#
+#====================================================
+
+class LineIndex:
+    """
+    Offsets of the start of each line of a growing text, for mapping a
+    character offset to a (line, column) pair by bisection.
+    """
+
+    def __init__(self):
+        """
+        """
+        self.starts = [0]
+        self.length = 0
+
+
+    def append(self, text):
+        start = self.length
+        pos = text.find("\n")
+        while pos != -1:
+            self.starts.append(start + pos + 1)
+            pos = text.find("\n", pos + 1)
+        self.length += len(text)
+
+
+    def position(self, offset):
+        """
+        Return (line, column) of a character offset.
+        """
+        line = bisect_right(self.starts, offset) - 1
+        return (line, offset - self.starts[line])
+
+
+
+#====================================================
+#
+# Class WikiTextView
+#
+#====================================================
+
+class WikiTextView(Gtk.Box):
+    """
+    Read-only view of wikitext, with a find bar.
+
+    The text is held in a Gtk.TextBuffer, which only lays out the lines
+    that are shown, and text can be appended a piece at a time while it
+    is being generated.
+    """
+
+    def __init__(self):
+        """
+        """
+        Gtk.Box.__init__(self, orientation=Gtk.Orientation.VERTICAL)
+        self.chunks = []
+        self.text = None        # Joined text
+        self.index = LineIndex()
+
+        # Find bar
+        find_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        self.find_entry = Gtk.SearchEntry()
+        self.find_entry.connect('activate', self.on_find_next)
+        self.find_entry.connect('next-match', self.on_find_next)
+        self.find_entry.connect('previous-match', self.on_find_previous)
+        find_box.pack_start(self.find_entry, expand=True, fill=True, padding=0)
+        prev_button = Gtk.Button.new_from_icon_name('go-up-symbolic',
+                                                    Gtk.IconSize.BUTTON)
+        prev_button.set_tooltip_text(_('Find previous'))
+        prev_button.connect('clicked', self.on_find_previous)
+        find_box.pack_start(prev_button, expand=False, fill=False, padding=0)
+        next_button = Gtk.Button.new_from_icon_name('go-down-symbolic',
+                                                    Gtk.IconSize.BUTTON)
+        next_button.set_tooltip_text(_('Find next'))
+        next_button.connect('clicked', self.on_find_next)
+        find_box.pack_start(next_button, expand=False, fill=False, padding=0)
+        self.pack_start(find_box, expand=False, fill=False, padding=0)
+
+        # Text
+        scrolled = Gtk.ScrolledWindow()
+        self.textview = Gtk.TextView()
+        self.textview.set_editable(False)
+        self.textview.set_monospace(True)
+        self.textview.set_wrap_mode(Gtk.WrapMode.WORD_CHAR)
+        self.buffer = self.textview.get_buffer()
+        scrolled.add(self.textview)
+        self.pack_start(scrolled, expand=True, fill=True, padding=0)
+
+
+    def set_text(self, text):
+        self.clear()
+        self.append(text)
+
+
+    def clear(self):
+        self.chunks = []
+        self.text = None
+        self.index = LineIndex()
+        self.buffer.set_text('')
+
+
+    def append(self, text):
+        """
+        Add text at the end of the view.
+        """
+        if not text:
+            return
+        self.chunks.append(text)
+        self.text = None
+        self.index.append(text)
+        self.buffer.insert(self.buffer.get_end_iter(), text)
+
+
+    def get_text(self):
+        if self.text is None:
+            self.text = ''.join(self.chunks)
+            self.chunks = [self.text]
+        return self.text
+
+
+    def on_find_next(self, widget):
+        self.find(self.find_entry.get_text(), forward=True)
+
+
+    def on_find_previous(self, widget):
+        self.find(self.find_entry.get_text(), forward=False)
+
+
+    def find(self, query, forward=True):
+        """
+        Select and scroll to the next (or previous) case-insensitive match
+        of query, wrapping around at the ends. Returns True if found.
+        """
+        if not query:
+            return False
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
+        text = self.get_text()
+
+        # Search from the current selection. The text is searched as it
+        # is, so match offsets are buffer offsets: lower-casing can change
+        # the length of a string.
+        bounds = self.buffer.get_selection_bounds()
+        if bounds:
+            sel_start, sel_end = [it.get_offset() for it in bounds]
+        else:
+            sel_start = sel_end = self.buffer.get_iter_at_mark(
+                    self.buffer.get_insert()).get_offset()
+
+        if forward:
+            match = pattern.search(text, sel_end) or pattern.search(text)
+        else:
+            match = None
+            for match in pattern.finditer(text, 0, sel_start):
+                pass
+            if match is None:
+                for match in pattern.finditer(text):
+                    pass
+        if match is None:
+            return False
+
+        start = self._iter_at(match.start())
+        end = self._iter_at(match.end())
+        self.buffer.select_range(start, end)
+        self.textview.scroll_to_iter(start, 0.1, False, 0.0, 0.5)
+        return True
+
+
+    def _iter_at(self, offset):
+        line, column = self.index.position(offset)
+        return self.buffer.get_iter_at_line_offset(line, column)
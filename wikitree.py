@@ -22,10 +22,11 @@
 from html import escape
 from datetime import datetime
 import json
-import requests
+import logging
 import sys
+import threading
+import time
 
-import pdb
 
 #------------------#
 # Gtk modules      #
@@ -34,15 +35,6 @@ import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk
 
-try:
-    gi.require_version('WebKit2', '4.0')
-    from gi.repository import WebKit2
-
-    import mwparserfromhell
-    import mwcomposerfromhell
-except:
-    pass
-
 
 #-------------------#
 # Gramps modules    #
@@ -64,19 +56,25 @@ from gramps.gen.db import DbTxn
 
 # Other gramplet modules
 from biowindow import BioWindow
+from bionotebook import BioNotebook
+from windowpool import get_window_pool
+from renderer import get_renderer
+from wikitreeapi import get_api, PERSON_FIELDS, RELATIVES_FIELDS
+from metrics import get_metrics
+from linkindex import get_link_index, people_changed, save_link_indexes
+from biotemplate import template_notes_changed
+from familycompare import (FamilyComparison, SAME, CONFLICT, MISSING, EXTRA)
+from crawl import BranchCrawl, match_branch, ANCESTORS, DESCENDANTS, NEW, LINKED
+from sync import LinkSync
+from discrepancy import DiscrepancyReport
+from relpath import RelationshipFinder
+from photocache import get_photo_cache, photo_url
 from services import (format_name, format_person_info, format_date,
                       get_wikitree_attributes,
                       get_wikitree_attributes_from_handle,
-                      save_wikitree_id_to_person)
+                      save_wikitree_id_to_person, save_wikitree_ids)
 
 
-have_cosanguinuity = False
-try:
-    from cosanguinuity import Pedigree
-    have_cosanguinuity = True
-except Exception as e:
-    pass
-
 #------------------#
 # Translation      #
 #------------------#
@@ -89,9 +87,27 @@ ngettext = glocale.translation.ngettext # else "nearby" comments are ignored
 
 
 
+# Labels and colours for the family comparison
+compare_roles = {'parent': _('Parent'), 'spouse': _('Spouse'),
+                 'child': _('Child')}
+compare_statuses = {SAME: _('same'), CONFLICT: _('conflict'),
+                    MISSING: _('not in Gramps'), EXTRA: _('not on WikiTree')}
+compare_colours = {SAME: '#000000', CONFLICT: '#c06000',
+                   MISSING: '#b00000', EXTRA: '#0050b0'}
+
+# Labels for the branch crawl
+crawl_statuses = {NEW: _('new link'), LINKED: _('already linked'),
+                  CONFLICT: _('conflict')}
+
+
 
 SEARCH_LIMIT = 25
 
+# Size of the profile photo in the view window, in pixels
+PHOTO_SIZE = 120
+
+LOG = logging.getLogger(".WikiTree")
+
 
 
 #====================================================
@@ -109,6 +125,7 @@ class WikiTree(Gramplet):
         self.gui.WIDGET = self.build_gui()
         self.gui.get_container_widget().remove(self.gui.textview)
         self.gui.get_container_widget().add(self.gui.WIDGET)
+        self.gui.WIDGET.connect('destroy', self.on_gramplet_removed)
 
 
     def db_changed(self):
@@ -116,6 +133,49 @@ class WikiTree(Gramplet):
         self.connect(self.dbstate.db, 'person-delete', self.update)
         self.connect(self.dbstate.db, 'person-update', self.update)
 
+        # Keep the indexes up to date, and save them a little while after
+        # the last change
+        self.save_indexes_id = None
+        for signal in ('person-add', 'person-delete', 'person-update'):
+            self.connect(self.dbstate.db, signal, self.on_people_changed)
+        for signal in ('note-add', 'note-delete', 'note-update'):
+            self.connect(self.dbstate.db, signal, self.on_notes_changed)
+
+
+    def on_people_changed(self, handles):
+        people_changed(self.dbstate.db, handles)
+        self.schedule_save_indexes()
+
+
+    def on_notes_changed(self, handles):
+        template_notes_changed(self.dbstate.db, handles)
+
+
+    def schedule_save_indexes(self):
+        if self.save_indexes_id is None:
+            self.save_indexes_id = GLib.timeout_add_seconds(10, self.save_indexes)
+
+
+    def save_indexes(self):
+        self.save_indexes_id = None
+        save_link_indexes()
+        return False
+
+
+    def on_save(self):
+        save_link_indexes()
+        self.on_gramplet_removed()
+
+
+    def on_gramplet_removed(self, *args):
+        """
+        Close the pooled windows and stop the render worker. Gramps has
+        no hook for this; it runs when the gramplet's widget is destroyed
+        and when Gramps saves the gramplets on exit.
+        """
+        get_window_pool().clear()
+        get_renderer().shutdown()
+
 
     def active_changed(self, handle):
         self.update()
@@ -207,15 +267,56 @@ class WikiTree(Gramplet):
         generate_box.pack_start(self.include_notes_button, \
                                 expand=False, fill=False, padding=0)
 
-        if have_cosanguinuity:
-            self.include_pedigree_collapse_button \
-                    = Gtk.CheckButton(label = _('Include pedigree collapse section'))
-            self.include_pedigree_collapse_button.set_active(False)
-            generate_box.pack_start(self.include_pedigree_collapse_button, \
-                                    expand=False, fill=False, padding=0)
+        self.include_pedigree_collapse_button \
+                = Gtk.CheckButton(label = _('Include pedigree collapse section'))
+        self.include_pedigree_collapse_button.set_active(False)
+        generate_box.pack_start(self.include_pedigree_collapse_button, \
+                                expand=False, fill=False, padding=0)
+
+        self.profile_button \
+                = Gtk.CheckButton(label = _('Show profile'))
+        self.profile_button.set_active(False)
+        generate_box.pack_start(self.profile_button, \
+                                expand=False, fill=False, padding=0)
 
         grid.attach(generate_box, 0, 4, 1, 1)
 
+        # Crawl branch buttons and depth
+        crawl_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+
+        self.crawl_ancestors_button = ButtonWithValues()
+        self.crawl_ancestors_button.set_label(_("Crawl Ancestors"))
+        self.crawl_ancestors_button.set_value('direction', ANCESTORS)
+        self.crawl_ancestors_button.connect("clicked", self.on_click_crawl)
+        crawl_box.pack_start(self.crawl_ancestors_button, \
+                             expand=False, fill=False, padding=0)
+
+        self.crawl_descendants_button = ButtonWithValues()
+        self.crawl_descendants_button.set_label(_("Crawl Descendants"))
+        self.crawl_descendants_button.set_value('direction', DESCENDANTS)
+        self.crawl_descendants_button.connect("clicked", self.on_click_crawl)
+        crawl_box.pack_start(self.crawl_descendants_button, \
+                             expand=False, fill=False, padding=0)
+
+        crawl_label = Gtk.Label(label=_("Generations:"))
+        crawl_box.pack_start(crawl_label, expand=False, fill=False, padding=5)
+        self.crawl_depth_spin = Gtk.SpinButton.new_with_range(1, 20, 1)
+        self.crawl_depth_spin.set_value(5)
+        crawl_box.pack_start(self.crawl_depth_spin, \
+                             expand=False, fill=False, padding=0)
+
+        grid.attach(crawl_box, 0, 5, 1, 1)
+
+        # Sync linked profiles
+        sync_button = Gtk.Button.new_with_label(_("Check Linked Profiles for Changes"))
+        sync_button.connect("clicked", self.on_click_sync)
+        grid.attach(sync_button, 0, 6, 1, 1)
+
+        # Network statistics
+        metrics_button = Gtk.Button.new_with_label(_("Network Statistics"))
+        metrics_button.connect("clicked", self.on_click_metrics)
+        grid.attach(metrics_button, 0, 7, 1, 1)
+
         grid.show_all()
         return grid
 
@@ -257,7 +358,8 @@ class WikiTree(Gramplet):
                 if len(dd) == 10:
                     details['DeathDate'] = dd
 
-        search_win = SearchWindow(details, db, person)
+        get_window_pool().show('search', active_handle, SearchWindow,
+                               details, db, person)
         self.uistate.set_busy_cursor(False)
         return
 
@@ -271,7 +373,8 @@ class WikiTree(Gramplet):
         if not wikitree_attr:
             return
 
-        view_win = ViewWindow(wikitree_attr['id'], db, person)
+        get_window_pool().show('view', wikitree_attr['id'], ViewWindow,
+                               wikitree_attr['id'], db, person)
         self.uistate.set_busy_cursor(False)
         return
 
@@ -281,14 +384,41 @@ class WikiTree(Gramplet):
         db = self.dbstate.db
         active_handle = self.get_active('Person')
         person = db.get_person_from_handle(active_handle)
-        bio_win = BioWindow(db, person, \
-                            self.include_witness_events_button.get_active(), \
-                            self.include_witnesses_button.get_active(), \
-                            self.include_notes_button.get_active() )
+        get_window_pool().show('bio', active_handle, BioWindow,
+                               db, person,
+                               self.include_witness_events_button.get_active(),
+                               self.include_witnesses_button.get_active(),
+                               self.include_notes_button.get_active(),
+                               self.include_pedigree_collapse_button.get_active(),
+                               self.profile_button.get_active())
         self.uistate.set_busy_cursor(False)
         return
 
 
+    def on_click_crawl(self, button):
+        db = self.dbstate.db
+        active_handle = self.get_active('Person')
+        person = db.get_person_from_handle(active_handle)
+        wikitree_attr = get_wikitree_attributes(db, person)
+        if not wikitree_attr:
+            return
+        get_window_pool().show('crawl', active_handle, CrawlWindow,
+                               db, person, wikitree_attr['id'],
+                               button.get_value('direction'),
+                               self.crawl_depth_spin.get_value_as_int())
+        return
+
+
+    def on_click_sync(self, arg):
+        get_window_pool().show('sync', None, SyncWindow, self.dbstate.db)
+        return
+
+
+    def on_click_metrics(self, arg):
+        get_window_pool().show('metrics', None, MetricsWindow)
+        return
+
+
     def on_click_update_id(self, arg):
         self.uistate.set_busy_cursor(True)
         db = self.dbstate.db
@@ -318,6 +448,8 @@ class WikiTree(Gramplet):
         else:
             self.id_entry.set_text('')
             self.view_button.set_sensitive(False)
+        self.crawl_ancestors_button.set_sensitive(bool(wikitree_attr))
+        self.crawl_descendants_button.set_sensitive(bool(wikitree_attr))
 
 
 
@@ -336,17 +468,6 @@ class ViewWindow(Gtk.Window):
         """
         Initialize window
         """
-        self.db = db
-        self.active_person = active_person
-
-        # Do we have all the necessary Python packages?
-        self.html_ok = False
-        try:
-            x = mwcomposerfromhell
-            self.html_ok = True
-        except NameError:
-            pass
-
         Gtk.Window.__init__(self, title=_("WikiTree Browser"))
         self.set_default_size(800, 800)
         box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
@@ -359,7 +480,6 @@ class ViewWindow(Gtk.Window):
         entry_label = Gtk.Label(_('WikiTree Id: '))
         entry_box.pack_start(entry_label, expand=False, fill=False, padding=0)
         self.entry_entry = Gtk.Entry()
-        self.entry_entry.set_text(wikitree_id)
         self.entry_entry.connect('activate', self.on_click_go)
         entry_box.pack_start(self.entry_entry, expand=False, fill=False, padding=0)
         entry_button = Gtk.Button.new_with_label(_('Go!'))
@@ -368,37 +488,58 @@ class ViewWindow(Gtk.Window):
         entry_save_button = Gtk.Button.new_with_label(_('Save Id to Active Person'))
         entry_save_button.connect('clicked', self.on_click_save_id)
         entry_box.pack_start(entry_save_button, expand=False, fill=False, padding=0)
+        relationship_button = Gtk.Button.new_with_label(_('Relationship to Active Person'))
+        relationship_button.connect('clicked', self.on_click_relationship)
+        entry_box.pack_start(relationship_button, expand=False, fill=False, padding=0)
         box.pack_start(entry_box, expand=False, fill=False, padding=5)
 
-        # Information
+        # Relationship to the active person
+        self.relationship_label = Gtk.Label(label='')
+        self.relationship_label.set_xalign(0)
+        self.relationship_label.set_selectable(True)
+        box.pack_start(self.relationship_label, expand=False, fill=False, padding=0)
+
+        # Information, with the profile photo
+        info_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        self.photo_image = Gtk.Image()
+        self.photo_image.set_valign(Gtk.Align.START)
+        info_box.pack_start(self.photo_image, expand=False, fill=False, padding=5)
         self.info_label = Gtk.Label(label='')
         self.info_label.set_xalign(0)
         self.info_label.connect('activate_link', self.link_handler)
-        box.pack_start(self.info_label, expand=False, fill=False, padding=5)
+        info_box.pack_start(self.info_label, expand=True, fill=True, padding=0)
+        box.pack_start(info_box, expand=False, fill=False, padding=5)
 
-        # Biography
-        bio_notebook = Gtk.Notebook()
+        # Comparison with the Gramps family
+        self.compare_expander = Gtk.Expander(label=_("Compare with Gramps family"))
+        self.compare_grid = Gtk.Grid()
+        self.compare_grid.set_row_spacing(4)
+        self.compare_grid.set_column_spacing(20)
+        self.compare_expander.add(self.compare_grid)
+        box.pack_start(self.compare_expander, expand=False, fill=False, padding=5)
 
-        if self.html_ok:
-            html_window = Gtk.ScrolledWindow()
-            self.html_window = WebKit2.WebView()
-            html_window.add(self.html_window)
-            bio_notebook.append_page(html_window, Gtk.Label(label=_("Formatted")))
-
-        bio_window = Gtk.ScrolledWindow()
-        self.bio_label = Gtk.Label(label='')
-        self.bio_label.set_yalign(0)
-        self.bio_label.set_xalign(0)
-        bio_window.add(self.bio_label)
-        bio_notebook.append_page(bio_window, Gtk.Label(label=_("WikiCode")))
-
-        box.pack_start(bio_notebook, expand=True, fill=True, padding=0)
+        # Biography
+        self.bio_notebook = BioNotebook('ViewWindow')
+        box.pack_start(self.bio_notebook, expand=True, fill=True, padding=0)
 
         self.add(box)
         box.show_all()
         self.show_all()
+        self.refresh(wikitree_id, db, active_person)
+
+
+    def refresh(self, wikitree_id, db, active_person):
+        """
+        Show the profile for a (possibly different) WikiTree id.
+        """
+        self.db = db
+        self.active_person = active_person
+        self.profile = None
+        self.relationship_label.set_text('')
+        self.entry_entry.set_text(wikitree_id)
         if wikitree_id:
-            self.fill_data(wikitree_id)
+            Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE,
+                                 self.fill_data, wikitree_id)
 
 
     def on_click_go(self, button):
@@ -421,6 +562,30 @@ class ViewWindow(Gtk.Window):
         """
         """
         save_wikitree_id_to_person(self.db, self.active_person, id)
+        get_link_index(self.db).set(self.active_person.get_handle(), id)
+
+
+    def on_click_relationship(self, button):
+        """
+        Show how the profile on screen is related to the active person.
+        """
+        if not self.profile or not self.active_person:
+            return True
+        start = time.perf_counter()
+        finder = RelationshipFinder(self.db)
+        finder.graph.add_relatives(self.profile)
+        path = finder.find(('g', self.active_person.get_handle()),
+                           finder.wikitree_node(self.profile['Name']))
+        if path is None:
+            text = _("No connection found (%d people searched).") % finder.visited
+        elif len(path) == 1:
+            text = _("This is the active person.")
+        else:
+            text = "\n".join(finder.describe(path))
+        LOG.debug("Relationship found in %.3f seconds, %d people searched",
+                  time.perf_counter() - start, finder.visited)
+        self.relationship_label.set_text(text)
+        return True
 
 
     def link_handler(self, label, uri):
@@ -434,41 +599,52 @@ class ViewWindow(Gtk.Window):
         """
         Get and format data for a person
         """
+        start = time.perf_counter()
+
         # Get profile information
-        url = 'https://api.wikitree.com/api.php'
-        data = {'action': 'getRelatives',
-                'keys': wikitree_id,
-                'getParents': '1',
-                'getSpouses': '1',
-                'getChildren': '1',
-                'getSiblings': '0',
-                'format': 'json'}
-        profile = requests.post(url, data)
+        api = get_api()
+        profile = api.call('getRelatives',
+                           keys=wikitree_id,
+                           getParents='1',
+                           getSpouses='1',
+                           getChildren='1',
+                           getSiblings='0',
+                           fields=RELATIVES_FIELDS)
         info_text = self.format_info(profile)
         self.info_label.set_markup(info_text)
+        self.show_comparison(wikitree_id, profile)
+        self.profile = profile[0]['items'][0]['person']
+        self.relationship_label.set_text('')
+        self.show_photo(self.profile)
 
         # Get bio information
-        data = {'action': 'getBio',
-                'key': wikitree_id,
-                'bioFormat': 'both'}
-        bio = requests.post(url,data)
-        bio_text = self.format_bio(bio)
-
-        self.bio_label.set_text(bio_text)
+        bio_text = api.get_bio(wikitree_id)
 
-        if self.html_ok:
-            wikicode = mwparserfromhell.parse(bio_text)
-            html = mwcomposerfromhell.compose(wikicode)
-            self.html_window.load_html(html, None)
+        self.bio_notebook.set_wikitext(bio_text, start)
 
         self.entry_entry.set_text(wikitree_id)
 
 
+    def show_photo(self, profile):
+        """
+        Show the photo of the profile, once its thumbnail is ready.
+        """
+        self.photo_image.clear()
+        url = photo_url(profile)
+        if not url:
+            return
+
+        def show(pixbuf):
+            if pixbuf is not None and self.profile is profile:
+                self.photo_image.set_from_pixbuf(pixbuf)
+        get_photo_cache().request(url, PHOTO_SIZE, show)
+
+
     def format_info(self, response):
         """
         Format basic information about a person.
         """
-        profile = json.loads(response.content)[0]['items'][0]
+        profile = response[0]['items'][0]
         prof = profile['person']
 
         # Basic information about person
@@ -480,7 +656,6 @@ class ViewWindow(Gtk.Window):
             father = prof['Parents'][fatherx]
             text += '<b>Father:</b> ' + format_name(father) + "\n"
         motherx = str(prof['Mother'])
-        # pdb.set_trace()
         if motherx and motherx != '0' and motherx != 'None':
             mother = prof['Parents'][motherx]
             text += '<b>Mother:</b> ' + format_name(mother) + "\n"
@@ -508,13 +683,43 @@ class ViewWindow(Gtk.Window):
         return text
 
 
-    def format_bio(self, response):
+    def show_comparison(self, wikitree_id, response):
         """
-        Format the biography information.
+        Compare the WikiTree relatives with the family of the Gramps person
+        linked to the profile, or else of the active person.
         """
-        bio = json.loads(response.content)[0]
-        text = bio['bio'] if 'bio' in bio else ''
-        return text
+        for child in self.compare_grid.get_children():
+            self.compare_grid.remove(child)
+
+        handle = get_link_index(self.db).get_handle(wikitree_id)
+        person = self.db.get_person_from_handle(handle) if handle \
+                 else self.active_person
+        if not person:
+            return
+        profile = response[0]['items'][0]['person']
+        rows = FamilyComparison(self.db, person, profile).compare()
+
+        headings = (_('Relation'), _('Gramps'), _('WikiTree'), _('Differences'))
+        for col, heading in enumerate(headings):
+            label = Gtk.Label()
+            label.set_markup('<b>%s</b>' % heading)
+            label.set_xalign(0)
+            self.compare_grid.attach(label, col, 0, 1, 1)
+
+        for row, (role, local, remote, status, notes) in enumerate(rows, 1):
+            colour = compare_colours[status]
+            local_text = escape('%s %s' % (local['first'], local['surname'])) \
+                         if local else '------'
+            texts = (compare_roles[role], local_text,
+                     format_name(remote) if remote else '------',
+                     escape(', '.join(notes) or compare_statuses[status]))
+            for col, text in enumerate(texts):
+                label = Gtk.Label()
+                label.set_markup('<span foreground="%s">%s</span>' % (colour, text))
+                label.set_xalign(0)
+                label.connect('activate_link', self.link_handler)
+                self.compare_grid.attach(label, col, row, 1, 1)
+        self.compare_grid.show_all()
 
 
 #====================================================
@@ -530,9 +735,6 @@ class SearchWindow(Gtk.Window):
     def __init__(self, search_details, db, active_person):
         """
         """
-        self.db = db
-        self.active_person = active_person
-
         Gtk.Window.__init__(self, title=_("WikiTree Search Results"))
         self.set_default_size(800, 800)
         box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
@@ -540,14 +742,9 @@ class SearchWindow(Gtk.Window):
         box.set_border_width(10)
 
         # Search parameters
-        args = ''
-        for d in search_details:
-            detail = search_details[d]
-            args += "<b>%s:</b> %s\n" % (self._fix_name(d), search_details[d])
-        args_label = Gtk.Label()
-        args_label.set_markup(args)
-        args_label.set_xalign(0)
-        box.pack_start(args_label, expand=False, fill=False, padding=0)
+        self.args_label = Gtk.Label()
+        self.args_label.set_xalign(0)
+        box.pack_start(self.args_label, expand=False, fill=False, padding=0)
 
         # Search results
         results_window = Gtk.ScrolledWindow()
@@ -562,10 +759,26 @@ class SearchWindow(Gtk.Window):
         self.add(box)
         box.show_all()
         self.show_all()
+        self.refresh(search_details, db, active_person)
+
+
+    def refresh(self, search_details, db, active_person):
+        """
+        Show the results of a new search.
+        """
+        self.db = db
+        self.active_person = active_person
+
+        args = ''
+        for d in search_details:
+            detail = search_details[d]
+            args += "<b>%s:</b> %s\n" % (self._fix_name(d), search_details[d])
+        self.args_label.set_markup(args)
 
         # Fill search results
+        for child in self.results_grid.get_children():
+            self.results_grid.remove(child)
         self.search(search_details)
-        return
 
 
     def _fix_name(self, name):
@@ -583,17 +796,13 @@ class SearchWindow(Gtk.Window):
     def search(self, search_details):
         """
         """
-        url = 'https://api.wikitree.com/api.php'
-        data = dict(search_details)
-        data['action'] = 'searchPerson'
-        results = requests.post(url, data)
-        if results:
-            results = json.loads(results.content)
+        matches = get_api().stream('searchPerson', 'item.matches.item',
+                                   fields=PERSON_FIELDS, **search_details)
 
         # Print out results
         text = ''
         line = 0
-        for match in results[0]['matches']:
+        for match in matches:
             if 'LongNamePrivate' in match:
                 lab = Gtk.Label(label='')
                 lab.set_markup(format_person_info(match, show_id=True))
@@ -629,7 +838,8 @@ class SearchWindow(Gtk.Window):
     def link_show_view(self, id):
         """
         """
-        view_win = ViewWindow(id, self.db, self.active_person)
+        get_window_pool().show('view', id, ViewWindow,
+                               id, self.db, self.active_person)
 
 
     def on_click_save_id(self, button):
@@ -642,6 +852,464 @@ class SearchWindow(Gtk.Window):
         """
         """
         save_wikitree_id_to_person(self.db, self.active_person, id)
+        get_link_index(self.db).set(self.active_person.get_handle(), id)
+
+
+#====================================================
+#
+# Class CrawlWindow
+#
+#====================================================
+
+class CrawlWindow(Gtk.Window):
+    """
+    Window showing the links proposed by crawling the WikiTree ancestors
+    or descendants of a person. The crawl runs in a background thread;
+    the proposed links are matched and shown once it is done.
+    """
+
+    def __init__(self, db, person, wikitree_id, direction, depth):
+        """
+        """
+        Gtk.Window.__init__(self, title=_("WikiTree Branch"))
+        self.set_default_size(800, 600)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        box.homogenous = False
+        box.set_border_width(10)
+
+        self.status_label = Gtk.Label(label='')
+        self.status_label.set_xalign(0)
+        box.pack_start(self.status_label, expand=False, fill=False, padding=0)
+
+        results_window = Gtk.ScrolledWindow()
+        self.results_grid = Gtk.Grid()
+        self.results_grid.set_border_width(6)
+        self.results_grid.set_row_spacing(6)
+        self.results_grid.set_column_spacing(20)
+        results_window.add(self.results_grid)
+        box.pack_start(results_window, expand=True, fill=True, padding=5)
+
+        self.link_button = Gtk.Button.new_with_label(_("Link Selected People"))
+        self.link_button.connect('clicked', self.on_click_link)
+        box.pack_start(self.link_button, expand=False, fill=False, padding=0)
+
+        self.add(box)
+        box.show_all()
+        self.show_all()
+
+        self.crawl = None
+        self.refresh(db, person, wikitree_id, direction, depth)
+
+
+    def refresh(self, db, person, wikitree_id, direction, depth):
+        """
+        Start crawling the branch of a (possibly different) person.
+        """
+        self.db = db
+        self.person = person
+        self.check_buttons = []
+        for child in self.results_grid.get_children():
+            self.results_grid.remove(child)
+        self.link_button.set_sensitive(False)
+        self.status_label.set_markup(_("Fetching %s of <b>%s</b>...")
+                                     % (_("ancestors") if direction == ANCESTORS
+                                        else _("descendants"),
+                                        escape(wikitree_id)))
+
+        # Results of an earlier crawl still running are ignored
+        crawl = self.crawl = BranchCrawl(wikitree_id, direction, depth)
+        def run():
+            crawl.run(lambda requests, people:
+                      GLib.idle_add(self.show_progress, crawl, requests, people))
+            GLib.idle_add(self.show_results, crawl)
+        threading.Thread(target=run, daemon=True).start()
+
+
+    def show_progress(self, crawl, requests, people):
+        if crawl is self.crawl:
+            self.status_label.set_markup(
+                    _("%d requests, %d people found...") % (requests, people))
+        return False
+
+
+    def show_results(self, crawl):
+        """
+        Match the crawled branch with the Gramps family, and list the
+        proposed links.
+        """
+        if crawl is not self.crawl:
+            return False
+        proposals = match_branch(self.db, self.person, crawl)
+
+        status = _("%d people found in %d requests, %d matched in Gramps.") \
+                 % (len(crawl.nodes), crawl.requests, len(proposals))
+        if crawl.errors:
+            status += "\n" + _("%d requests failed.") % len(crawl.errors)
+        self.status_label.set_text(status)
+
+        for row, (handle, remote, gen, status, notes) in enumerate(proposals):
+            local = self.db.get_person_from_handle(handle)
+            check = Gtk.CheckButton(
+                    label=name_displayer.display_name(local.get_primary_name()))
+            check.set_active(status == NEW)
+            check.set_sensitive(status != LINKED)
+            self.check_buttons.append((check, handle, remote['Name']))
+            self.results_grid.attach(check, 0, row, 1, 1)
+
+            label = Gtk.Label()
+            label.set_markup(format_name(remote) + ' [%s]' % escape(remote['Name']))
+            label.set_xalign(0)
+            label.connect('activate_link', self.link_handler)
+            self.results_grid.attach(label, 1, row, 1, 1)
+
+            text = _("generation %d") % gen + ', ' + crawl_statuses[status]
+            if notes:
+                text += ': ' + ', '.join(notes)
+            label = Gtk.Label(label=text)
+            label.set_xalign(0)
+            self.results_grid.attach(label, 2, row, 1, 1)
+
+        self.link_button.set_sensitive(bool(proposals))
+        self.results_grid.show_all()
+        return False
+
+
+    def link_handler(self, label, uri):
+        """
+        """
+        get_window_pool().show('view', uri, ViewWindow,
+                               uri, self.db, self.person)
+        return True
+
+
+    def on_click_link(self, button):
+        """
+        Save the WikiTree ids of all the selected people at once.
+        """
+        links = [(handle, wikitree_id)
+                 for (check, handle, wikitree_id) in self.check_buttons
+                 if check.get_active() and check.get_sensitive()]
+        if not links:
+            return True
+        save_wikitree_ids(self.db, links)
+        index = get_link_index(self.db)
+        for handle, wikitree_id in links:
+            index.set(handle, wikitree_id)
+        for check, handle, wikitree_id in self.check_buttons:
+            if (handle, wikitree_id) in links:
+                check.set_sensitive(False)
+        return True
+
+
+#====================================================
+#
+# Class SyncWindow
+#
+#====================================================
+
+class SyncWindow(Gtk.Window):
+    """
+    Window listing the linked WikiTree profiles changed upstream since
+    the last sync. The check runs in a background thread.
+    """
+
+    def __init__(self, db):
+        """
+        """
+        Gtk.Window.__init__(self, title=_("WikiTree Changes"))
+        self.set_default_size(700, 600)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        box.homogenous = False
+        box.set_border_width(10)
+
+        self.status_label = Gtk.Label(label='')
+        self.status_label.set_xalign(0)
+        box.pack_start(self.status_label, expand=False, fill=False, padding=0)
+
+        results_window = Gtk.ScrolledWindow()
+        self.results_grid = Gtk.Grid()
+        self.results_grid.set_border_width(6)
+        self.results_grid.set_row_spacing(6)
+        self.results_grid.set_column_spacing(20)
+        results_window.add(self.results_grid)
+        box.pack_start(results_window, expand=True, fill=True, padding=5)
+
+        button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        self.mark_button = Gtk.Button.new_with_label(_("Mark as Synced"))
+        self.mark_button.connect('clicked', self.on_click_mark)
+        button_box.pack_start(self.mark_button, expand=False, fill=False, padding=0)
+        report_button = Gtk.Button.new_with_label(_("Discrepancy Report"))
+        report_button.connect('clicked', self.on_click_report)
+        button_box.pack_start(report_button, expand=False, fill=False, padding=0)
+        box.pack_start(button_box, expand=False, fill=False, padding=0)
+
+        self.add(box)
+        box.show_all()
+        self.show_all()
+
+        self.sync = None
+        self.refresh(db)
+
+
+    def refresh(self, db):
+        """
+        Start a new check.
+        """
+        self.db = db
+        for child in self.results_grid.get_children():
+            self.results_grid.remove(child)
+        self.mark_button.set_sensitive(False)
+
+        sync = self.sync = LinkSync().collect(db)
+        self.status_label.set_text(_("Checking %d linked profiles...")
+                                   % len(sync.links))
+        def run():
+            sync.fetch(lambda done, total:
+                       GLib.idle_add(self.show_progress, sync, done, total))
+            GLib.idle_add(self.show_results, sync)
+        threading.Thread(target=run, daemon=True).start()
+
+
+    def show_progress(self, sync, done, total):
+        if sync is self.sync:
+            self.status_label.set_text(_("Checked %d of %d linked profiles...")
+                                       % (done, total))
+        return False
+
+
+    def show_results(self, sync):
+        """
+        List the changed profiles.
+        """
+        if sync is not self.sync:
+            return False
+
+        status = _("%d linked profiles, %d changed upstream, %d checked "
+                   "for the first time, %d not found.") \
+                 % (len(sync.links), len(sync.changed), len(sync.first_seen),
+                    len(sync.not_found))
+        if sync.errors:
+            status += "\n" + _("%d requests failed.") % len(sync.errors)
+        if sync.unfetched:
+            status += "\n" + _("%d changed profiles could not be fetched, and "
+                               "stay pending until the next sync.") \
+                      % len(sync.unfetched)
+        self.status_label.set_text(status)
+
+        unfetched = set(sync.unfetched)
+        rows = [(handle, wikitree_id,
+                 _('changed %s, not fetched') % self._format_touched(new)
+                 if wikitree_id in unfetched
+                 else _('changed %s') % self._format_touched(new))
+                for handle, wikitree_id, old, new in sync.changed] \
+               + [(handle, wikitree_id, _('not found on WikiTree'))
+                  for handle, wikitree_id in sync.not_found]
+        for row, (handle, wikitree_id, text) in enumerate(rows):
+            person = self.db.get_person_from_handle(handle)
+            label = Gtk.Label(label=name_displayer.display_name(person.get_primary_name()))
+            label.set_xalign(0)
+            self.results_grid.attach(label, 0, row, 1, 1)
+
+            label = Gtk.Label()
+            label.set_markup('<a href="%s">%s</a>' % (escape(wikitree_id),
+                                                      escape(wikitree_id)))
+            label.set_xalign(0)
+            label.connect('activate_link', self.link_handler)
+            self.results_grid.attach(label, 1, row, 1, 1)
+
+            label = Gtk.Label(label=text)
+            label.set_xalign(0)
+            self.results_grid.attach(label, 2, row, 1, 1)
+
+        self.mark_button.set_sensitive(bool(sync.stored))
+        self.results_grid.show_all()
+        return False
+
+
+    def _format_touched(self, touched):
+        """
+        Format a WikiTree timestamp (YYYYMMDDHHMMSS).
+        """
+        touched = touched or ''
+        if len(touched) != 14:
+            return touched
+        return '%s-%s-%s %s:%s' % (touched[0:4], touched[4:6], touched[6:8],
+                                   touched[8:10], touched[10:12])
+
+
+    def link_handler(self, label, uri):
+        """
+        """
+        handle = get_link_index(self.db).get_handle(uri)
+        person = self.db.get_person_from_handle(handle) if handle else None
+        get_window_pool().show('view', uri, ViewWindow, uri, self.db, person)
+        return True
+
+
+    def on_click_mark(self, button):
+        self.sync.mark_synced(self.db)
+        self.mark_button.set_sensitive(False)
+        return True
+
+
+    def on_click_report(self, button):
+        get_window_pool().show('discrepancy', None, DiscrepancyWindow, self.db)
+        return True
+
+
+#====================================================
+#
+# Class DiscrepancyWindow
+#
+#====================================================
+
+class DiscrepancyWindow(Gtk.Window):
+    """
+    Sortable table of the differences between the Gramps data of the
+    linked people and their cached WikiTree profiles.
+    """
+
+    columns = (_('Person'), _('WikiTree Id'), _('Field'), _('Discrepancy'),
+               _('Gramps'), _('WikiTree'), _('Difference'))
+
+    def __init__(self, db):
+        """
+        """
+        Gtk.Window.__init__(self, title=_("WikiTree Discrepancies"))
+        self.set_default_size(900, 600)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        box.homogenous = False
+        box.set_border_width(10)
+
+        self.status_label = Gtk.Label(label='')
+        self.status_label.set_xalign(0)
+        box.pack_start(self.status_label, expand=False, fill=False, padding=0)
+
+        self.store = Gtk.ListStore(str, str, str, str, str, str, int)
+        self.view = view = Gtk.TreeView(model=self.store)
+        for col, title in enumerate(self.columns):
+            column = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=col)
+            column.set_sort_column_id(col)
+            column.set_resizable(True)
+            view.append_column(column)
+        view.connect('row-activated', self.on_row_activated)
+        results_window = Gtk.ScrolledWindow()
+        results_window.add(view)
+        box.pack_start(results_window, expand=True, fill=True, padding=5)
+
+        self.add(box)
+        box.show_all()
+        self.show_all()
+        self.refresh(db)
+
+
+    def refresh(self, db):
+        """
+        Compare the data again.
+        """
+        self.db = db
+        start = time.perf_counter()
+        report = DiscrepancyReport(db).load()
+        discrepancies = report.compare()
+
+        # Fill the store detached from the view, which is much faster
+        self.view.set_model(None)
+        self.store.clear()
+        for handle, wikitree_id, field, kind, local, remote, delta \
+                in discrepancies:
+            self.store.append((report.names[handle], wikitree_id, field, kind,
+                               local, remote, delta))
+        self.view.set_model(self.store)
+
+        self.status_label.set_text(
+                _("%d discrepancies in %d linked people, in %.1f seconds.")
+                % (len(discrepancies), len(report.rows),
+                   time.perf_counter() - start))
+
+
+    def on_row_activated(self, view, path, column):
+        wikitree_id = self.store[path][1]
+        handle = get_link_index(self.db).get_handle(wikitree_id)
+        person = self.db.get_person_from_handle(handle) if handle else None
+        get_window_pool().show('view', wikitree_id, ViewWindow,
+                               wikitree_id, self.db, person)
+
+
+#====================================================
+#
+# Class MetricsWindow
+#
+#====================================================
+
+class MetricsWindow(Gtk.Window):
+    """
+    Window showing WikiTree API metrics: latency, bytes received, status
+    codes and cache hit rate per API action.
+    """
+
+    def __init__(self):
+        """
+        """
+        Gtk.Window.__init__(self, title=_("WikiTree Network Statistics"))
+        self.set_default_size(700, 300)
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        box.homogenous = False
+        box.set_border_width(10)
+
+        self.metrics_label = Gtk.Label(label='')
+        self.metrics_label.set_xalign(0)
+        self.metrics_label.set_yalign(0)
+        self.metrics_label.set_selectable(True)
+        box.pack_start(self.metrics_label, expand=True, fill=True, padding=5)
+
+        button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        refresh_button = Gtk.Button.new_with_label(_('Refresh'))
+        refresh_button.connect('clicked', self.on_click_refresh)
+        button_box.pack_start(refresh_button, expand=False, fill=False, padding=0)
+        export_button = Gtk.Button.new_with_label(_('Export for Prometheus...'))
+        export_button.connect('clicked', self.on_click_export)
+        button_box.pack_start(export_button, expand=False, fill=False, padding=0)
+        box.pack_start(button_box, expand=False, fill=False, padding=0)
+
+        self.add(box)
+        box.show_all()
+        self.show_all()
+        self.refresh()
+
+
+    def refresh(self):
+        """
+        Show the current metrics.
+        """
+        text = "<tt><b>%-16s %8s %9s %9s %12s %6s</b>\n" \
+                % (_('Action'), _('Calls'), _('Mean ms'), _('p95 ms'),
+                   _('Bytes'), _('Cache'))
+        for (action, calls, mean, p95, received, hit_rate, statuses) \
+                in get_metrics().summary_rows():
+            text += "%-16s %8d %9.0f %9s %12d %5.0f%%  %s\n" \
+                    % (action, calls, mean * 1000,
+                       '%.0f' % (p95 * 1000) if p95 != float('inf') else '&gt;10000',
+                       received, hit_rate * 100,
+                       ' '.join('%s:%d' % s for s in sorted(statuses.items())))
+        self.metrics_label.set_markup(text + "</tt>")
+
+
+    def on_click_refresh(self, button):
+        self.refresh()
+        return True
+
+
+    def on_click_export(self, button):
+        dialog = Gtk.FileChooserDialog(title=_("Export Metrics"), parent=self,
+                                       action=Gtk.FileChooserAction.SAVE)
+        dialog.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                           Gtk.STOCK_SAVE, Gtk.ResponseType.OK)
+        dialog.set_current_name('wikitree.prom')
+        dialog.set_do_overwrite_confirmation(True)
+        if dialog.run() == Gtk.ResponseType.OK:
+            get_metrics().write_prometheus(dialog.get_filename())
+        dialog.destroy()
+        return True
 
 
 #====================================================
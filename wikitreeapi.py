@@ -0,0 +1,284 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from collections import OrderedDict
+from urllib.parse import urlencode
+import json
+import threading
+import time
+
+import requests
+
+try:
+    import orjson
+    have_orjson = True
+except ImportError:
+    have_orjson = False
+
+try:
+    import ijson
+    have_ijson = True
+except ImportError:
+    have_ijson = False
+
+
+# Other gramplet modules
+from metrics import get_metrics
+
+
+
+API_URL = 'https://api.wikitree.com/api.php'
+
+# Responses are cached for this many seconds
+CACHE_SECONDS = 300
+CACHE_ENTRIES = 256
+
+# Profile fields requested for each use. Unless fields are given, the API
+# returns every field of every profile.
+
+# People shown in the view window, search results and crawls, and
+# compared with Gramps people
+PERSON_FIELDS = ('Id,Name,LongName,LongNamePrivate,FirstName,RealName,'
+                 'LastNameAtBirth,LastNameCurrent,Gender,BirthDate,DeathDate,'
+                 'BirthLocation,DeathLocation,Father,Mother')
+
+# A person with their photo, parents, spouses and children (getRelatives)
+RELATIVES_FIELDS = PERSON_FIELDS + ',PhotoData,Parents,Spouses,Children'
+
+# Biography format: the view only shows the wiki text
+BIO_FORMAT = 'wiki'
+
+# Bytes read from the socket at a time when streaming
+STREAM_CHUNK = 64 * 1024
+
+_api = None
+
+
+
+def get_api():
+    """
+    The API client shared by the gramplet.
+    """
+    global _api
+    if _api is None:
+        _api = WikiTreeApi()
+    return _api
+
+
+def loads(content):
+    """
+    Decode a JSON response, with orjson if it is available.
+    """
+    if have_orjson:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def select_items(result, prefix):
+    """
+    The items of a decoded response at an ijson prefix, such as
+    'item.ancestors.item', where 'item' stands for each element of a list.
+    """
+    results = [result]
+    for key in prefix.split('.'):
+        selected = []
+        for value in results:
+            if key == 'item':
+                selected.extend(value or ())
+            elif isinstance(value, dict) and value.get(key) is not None:
+                selected.append(value[key])
+        results = selected
+    return results
+
+
+
+#====================================================
+#
+# Class WikiTreeApi
+#
+#====================================================
+
+class WikiTreeApi:
+    """
+    Client for the WikiTree API. Keeps one HTTP session open, caches
+    responses for a short time, and records metrics for every call.
+    """
+
+    def __init__(self, url=API_URL, cache_seconds=CACHE_SECONDS,
+                 cache_entries=CACHE_ENTRIES, metrics=None):
+        """
+        """
+        self.url = url
+        self.cache_seconds = cache_seconds
+        self.cache_entries = cache_entries
+        self.metrics = metrics or get_metrics()
+        self.session = requests.Session()
+        self.cache = OrderedDict()      # key -> (expiry time, result)
+        self.lock = threading.Lock()
+
+
+    def call(self, action, use_cache=True, **params):
+        """
+        Call an API action, and return the decoded JSON response.
+        Raises requests.HTTPError for error responses.
+        """
+        data = dict(params)
+        data['action'] = action
+        data.setdefault('format', 'json')
+        key = tuple(sorted((k, str(v)) for k, v in data.items()))
+
+        if use_cache:
+            result = self._cache_get(key)
+            if result is not None:
+                self.metrics.cache_hit(action)
+                return result
+            self.metrics.cache_miss(action)
+
+        # Bytes received are counted after requests has decompressed
+        # the body, so they are the size of the JSON, not of the transfer
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url, data)
+            content = response.content
+        except requests.RequestException:
+            self.metrics.observe(action, time.perf_counter() - start,
+                                 'error', len(urlencode(data)), 0)
+            raise
+        self.metrics.observe(action, time.perf_counter() - start,
+                             response.status_code, len(urlencode(data)),
+                             len(content))
+        response.raise_for_status()
+        result = loads(content)
+
+        if use_cache:
+            self._cache_put(key, result)
+        return result
+
+
+    def get_bio(self, key):
+        """
+        The biography of a profile, in wiki text.
+        """
+        response = self.call('getBio', key=key, bioFormat=BIO_FORMAT)
+        return response[0].get('bio') or ''
+
+
+    def stream(self, action, prefix, **params):
+        """
+        Call an API action, and yield the items of the response at an
+        ijson prefix (see select_items) as they arrive, so the whole
+        response is never in memory at once. Without ijson, the response
+        is decoded in one piece and its items yielded. Streamed responses
+        are not cached. Raises requests.HTTPError for error responses.
+        """
+        data = dict(params)
+        data['action'] = action
+        data.setdefault('format', 'json')
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url, data, stream=have_ijson)
+        except requests.RequestException:
+            self.metrics.observe(action, time.perf_counter() - start,
+                                 'error', len(urlencode(data)), 0)
+            raise
+        reader = _CountingReader(response)
+        try:
+            if response.status_code >= 400:
+                reader.read()
+                response.raise_for_status()
+            if have_ijson:
+                yield from ijson.items(reader, prefix, use_float=True)
+            else:
+                yield from select_items(loads(reader.read()), prefix)
+        finally:
+            response.close()
+            self.metrics.observe(action, time.perf_counter() - start,
+                                 response.status_code, len(urlencode(data)),
+                                 reader.bytes_read)
+
+
+    def clear_cache(self):
+        with self.lock:
+            self.cache.clear()
+
+
+    def _cache_get(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+            expiry, result = entry
+            if expiry < time.monotonic():
+                del self.cache[key]
+                return None
+            self.cache.move_to_end(key)
+            return result
+
+
+    def _cache_put(self, key, result):
+        with self.lock:
+            self.cache[key] = (time.monotonic() + self.cache_seconds, result)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_entries:
+                self.cache.popitem(last=False)
+
+
+
+#====================================================
+#
+# Class _CountingReader
+#
+#====================================================
+
+class _CountingReader:
+    """
+    File-like reader over the body of a streamed response, counting the
+    bytes read for the metrics.
+    """
+
+    def __init__(self, response):
+        """
+        """
+        self.chunks = response.iter_content(STREAM_CHUNK)
+        self.buffer = b''
+        self.bytes_read = 0
+
+
+    def read(self, size=-1):
+        """
+        Read up to size bytes; all the remaining bytes if size is negative.
+        """
+        if size < 0:
+            chunks = [self.buffer]
+            for chunk in self.chunks:
+                self.bytes_read += len(chunk)
+                chunks.append(chunk)
+            self.buffer = b''
+            return b''.join(chunks)
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.bytes_read += len(chunk)
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
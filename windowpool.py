@@ -0,0 +1,144 @@
+# WikiTree - WikiTree Integration
+#
+# Copyright (C) 2021  Hans Boldt
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+#-------------------#
+# Python modules    #
+#-------------------#
+from collections import OrderedDict
+
+#------------------#
+# Gtk modules      #
+#------------------#
+import gi
+gi.require_version('Gtk', '3.0')
+
+try:
+    gi.require_version('WebKit2', '4.0')
+    from gi.repository import WebKit2
+except (ImportError, ValueError):
+    pass
+
+
+
+# Number of windows of each kind kept alive for reuse. With WebKitGTK
+# 2.26 and later, every WebView has its own web process, so these sizes
+# are also the cap on the number of web processes.
+MAX_WINDOWS = {'view': 2, 'search': 1, 'bio': 2}
+DEFAULT_MAX_WINDOWS = 1
+
+# Web processes, for WebKitGTK before 2.26
+MAX_WEB_PROCESSES = 1
+
+_web_context = None
+_window_pool = None
+
+
+
+def new_webview():
+    """
+    Create a WebView in the gramplet's own WebContext.
+
+    Before WebKitGTK 2.26, the views in the context share a limited
+    number of web processes. Later versions ignore the process model and
+    the limit, and give each view its own process; there, only the
+    window pool bounds the number of views, and so of processes.
+    """
+    global _web_context
+    if _web_context is None:
+        _web_context = WebKit2.WebContext.new()
+        if WebKit2.get_major_version() == 2 \
+                and WebKit2.get_minor_version() < 26:
+            _web_context.set_process_model(
+                    WebKit2.ProcessModel.MULTIPLE_SECONDARY_PROCESSES)
+            _web_context.set_web_process_count_limit(MAX_WEB_PROCESSES)
+    return WebKit2.WebView.new_with_context(_web_context)
+
+
+def get_window_pool():
+    """
+    The window pool shared by the gramplet.
+    """
+    global _window_pool
+    if _window_pool is None:
+        _window_pool = WindowPool()
+    return _window_pool
+
+
+
+#====================================================
+#
+# Class WindowPool
+#
+#====================================================
+
+class WindowPool:
+    """
+    Keep a few windows of each kind, and reuse them rather than creating
+    new ones.
+
+    Windows are looked up by kind and key (such as a WikiTree id). Asking
+    again for a window with the same key refreshes and raises the
+    existing window. Once a kind has its maximum number of windows, the
+    least recently used one is refreshed with the new content. Closing a
+    pooled window only hides it.
+
+    Pooled window classes take the same arguments in their constructor
+    and in their refresh() method.
+    """
+
+    def __init__(self, max_windows=None):
+        """
+        """
+        self.max_windows = max_windows or MAX_WINDOWS
+        self.windows = {}       # kind -> OrderedDict of key -> window
+
+
+    def show(self, kind, key, window_class, *args):
+        """
+        Show a window of the given kind for key, and return it.
+        """
+        windows = self.windows.setdefault(kind, OrderedDict())
+        window = windows.pop(key, None)
+        limit = self.max_windows.get(kind, DEFAULT_MAX_WINDOWS)
+        if window is None and len(windows) >= limit:
+            old_key, window = windows.popitem(last=False)
+
+        if window is None:
+            window = window_class(*args)
+            window.connect('delete-event', self.on_delete)
+        else:
+            window.refresh(*args)
+        windows[key] = window
+        window.show_all()
+        window.present()
+        return window
+
+
+    def on_delete(self, window, event):
+        window.hide()
+        return True
+
+
+    def clear(self):
+        """
+        Destroy all pooled windows.
+        """
+        for windows in self.windows.values():
+            for window in windows.values():
+                window.destroy()
+        self.windows = {}